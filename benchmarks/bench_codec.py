@@ -0,0 +1,56 @@
+import sys
+import time
+
+from rftg.cards import Library, ImageMode
+from rftg.game import GameResource, Game, Player
+from rftg.engine import Engine
+from rftg.decision import RandomDecision
+from rftg import codec
+
+# Encode and decode game states with the bulk codec, against dumping the
+# deck card by card through the marshmallow schemas.
+#
+#   python -m benchmarks.bench_codec [num_games num_players expansion]
+
+
+def make_games(resource, num_games=100, num_players=4, expansion=2, rounds=6):
+  games = []
+  for seed in range(num_games):
+    players = [ Player(name='Player {}'.format(i), ai=True) for i in range(num_players) ]
+    game = Game(resource=resource, players=players, expanded=expansion, start_seed=seed)
+    game.decisions = [ RandomDecision(game, seed * num_players + i) for i in range(num_players) ]
+    Engine(game).play(until_round=rounds)
+    games.append(game)
+  return games
+
+
+def timed(function, games):
+  start = time.perf_counter()
+  result = [ function(game) for game in games ]
+  return (time.perf_counter() - start, result)
+
+
+def main(num_games=100, num_players=4, expansion=2):
+  library = Library()
+  library.setup(images=ImageMode.NONE)
+  resource = GameResource(library=library)
+  games = make_games(resource, num_games, num_players, expansion)
+
+  (marshmallow, dumps) = timed(lambda game: [ card.to_json() for card in game.deck.cards ], games)
+  (json_encode, lines) = timed(codec.encode_json, games)
+  (json_decode, decoded) = timed(lambda line: codec.decode_json(line, resource), lines)
+  (binary_encode, records) = timed(codec.encode_binary, games)
+  (binary_decode, decoded) = timed(lambda record: codec.decode_binary(record, resource)[0], records)
+
+  print('{} games, {} players, expansion {}'.format(num_games, num_players, expansion))
+  print('marshmallow deck dump {:8.0f} us/game'.format(marshmallow / num_games * 1e6))
+  print('json encode           {:8.0f} us/game, {:6.0f} bytes'.format(
+    json_encode / num_games * 1e6, sum(map(len, lines)) / num_games))
+  print('json decode           {:8.0f} us/game'.format(json_decode / num_games * 1e6))
+  print('binary encode         {:8.0f} us/game, {:6.0f} bytes'.format(
+    binary_encode / num_games * 1e6, sum(map(len, records)) / num_games))
+  print('binary decode         {:8.0f} us/game'.format(binary_decode / num_games * 1e6))
+
+
+if __name__ == '__main__':
+  main(*[ int(arg) for arg in sys.argv[1:] ])
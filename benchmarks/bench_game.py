@@ -0,0 +1,27 @@
+import pstats
+import sys
+
+from rftg.engine import simulate
+
+# Games per second of the headless engine with random players, for each
+# player count. With --profile, the games run under cProfile and the
+# functions taking the most time are listed.
+#
+#   python -m benchmarks.bench_game [num_games expansion] [--profile]
+
+PROFILE_FILENAME = 'bench_game.prof'
+
+
+def main(num_games=100, expansion=2, profile=False):
+  for num_players in range(2, 7):
+    if num_players > 4 + expansion:
+      break
+    report = simulate(num_games, num_players, expansion, profile=PROFILE_FILENAME if profile else None)
+    print('{players} players: {games_per_second:7.1f} games/s, {rounds:4.1f} rounds per game'.format(**report))
+    if profile:
+      pstats.Stats(PROFILE_FILENAME).sort_stats('tottime').print_stats(10)
+
+
+if __name__ == '__main__':
+  args = [ int(arg) for arg in sys.argv[1:] if not arg.startswith('--') ]
+  main(*args, profile='--profile' in sys.argv)
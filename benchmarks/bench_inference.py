@@ -0,0 +1,51 @@
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+from rftg.network import NetworkRegistry
+from rftg.inference import InferenceBroker
+
+# Many AI seats evaluating candidate positions concurrently, each running
+# the network itself against submitting to one InferenceBroker.
+#
+#   python -m benchmarks.bench_inference [seats requests]
+
+KEY = ('eval', 2, 4, False)
+
+
+def run_seats(seats, requests, evaluate, num_input):
+  def seat(seed):
+    rng = np.random.default_rng(seed)
+    for request in range(requests):
+      evaluate((rng.random((4, num_input)) < 0.05).astype(np.float32))
+
+  threads = [ threading.Thread(target=seat, args=(seed,)) for seed in range(seats) ]
+  start = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return time.perf_counter() - start
+
+
+def main(seats=128, requests=50):
+  registry = NetworkRegistry()
+  network = registry.get(*KEY)
+  direct = run_seats(seats, requests, network.forward_batch, network.num_input)
+
+  broker = InferenceBroker(registry)
+  brokered = run_seats(seats, requests, lambda X: broker.evaluate(KEY, X), network.num_input)
+  broker.close()
+
+  total = seats * requests
+  print('{} seats x {} requests: direct {:8.0f} requests/s, broker {:8.0f} requests/s'.format(
+    seats, requests, total / direct, total / brokered))
+  stats = broker.stats()
+  print(json.dumps({ 'batch_size': stats['batch_size'], 'latency': stats['latency'] }, indent=1))
+
+
+if __name__ == '__main__':
+  main(*[ int(arg) for arg in sys.argv[1:] ])
@@ -0,0 +1,133 @@
+import sys
+import tracemalloc
+
+from rftg.enums import *
+from rftg.cards import Library, ImageMode, Card, CardState, Power, Bonus, CardExpansion
+from rftg.game import GameResource, Game, Player
+
+# Memory held per model object and per game, measured with tracemalloc,
+# for the slotted and structure-of-arrays classes (after) against the
+# dict-backed layout they replaced (before), rebuilt here as plain
+# attribute classes with the same fields. The library is shared by all
+# games and measured on its own.
+#
+#   python -m benchmarks.bench_memory [num_players expansion]
+
+
+def allocated(build, count=1000):
+  tracemalloc.start()
+  before = tracemalloc.take_snapshot()
+  objects = [ build() for i in range(count) ]
+  after = tracemalloc.take_snapshot()
+  tracemalloc.stop()
+  size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+  # do not count the list holding the objects
+  return (size - sys.getsizeof(objects)) / count
+
+
+# dict-backed layout: Power, PowerWhere and CardExpansion took their keyword
+# arguments with __dict__.update, Card, Bonus and Player set attributes in __init__,
+# and a deck card kept its name and CardState slot in its __dict__
+class KeywordRecord:
+
+  def __init__(self, **kwargs):
+    self.__dict__.update(kwargs)
+
+
+class DictCard:
+
+  def __init__(self, index=0, name='', covering=False, num_goods=0, owner=-1, location=Location.DECK, order=0):
+    self.index = index
+    self.name = name
+    self.covering = covering
+    self.num_goods = num_goods
+    self.owner = owner
+    self.location = location
+    self.order = order
+
+
+class DictCardView:
+
+  def __init__(self, state, slot, name):
+    self._state = state
+    self._slot = slot
+    self.name = name
+
+
+class DictBonus:
+
+  def __init__(self, point=0, type=VP.NOVELTY_PRODUCTION, name=''):
+    self.point = point
+    self.type = type
+    self.name = name
+
+
+class DictPlayer:
+
+  def __init__(self, **kwargs):
+    # the attributes of Player, set one by one as its __init__ did
+    for (name, value) in _player_fields(Player(**kwargs)):
+      setattr(self, name, value)
+
+
+def _player_fields(player):
+  for name in player.__slots__:
+    if hasattr(player, name):
+      value = getattr(player, name)
+      yield (name, list(value) if isinstance(value, list) else value)
+
+
+def make_players(num_players):
+  return [ Player(name='Player {}'.format(i), ai=True) for i in range(num_players) ]
+
+
+def main(num_players=4, expansion=2):
+  library = Library()
+  library.setup(images=ImageMode.NONE)
+  resource = GameResource(library=library)
+
+  def make_game():
+    game = Game(resource=resource, players=make_players(num_players), start_seed=1)
+    game.deck.build_deck(expansion)
+    return game
+
+  game = make_game()
+  num_cards = len(game.deck.cards)
+  designs = [ library.designs[card.index] for card in game.deck.cards ]
+
+  def make_cards(view):
+    state = CardState(len(designs))
+    state.set_designs(designs)
+    return [ view(state, slot, design.name) for (slot, design) in enumerate(designs) ]
+
+  rows = [
+    ('Card', lambda: DictCard(index=7, name='Card'), lambda: Card(index=7, name='Card')),
+    ('Power', lambda: KeywordRecord(phase=4, code=PhasePower.P4_GET_VP, value=1, times=1),
+      lambda: Power(phase=4, code=PhasePower.P4_GET_VP, value=1, times=1)),
+    ('Bonus', lambda: DictBonus(3, VP.DEVEL, 'Bonus'), lambda: Bonus(3, VP.DEVEL, 'Bonus')),
+    ('CardExpansion', lambda: KeywordRecord(index=0, count=1), lambda: CardExpansion(index=0, count=1)),
+    ('Player', lambda: DictPlayer(name='Player', ai=True), lambda: Player(name='Player', ai=True)),
+  ]
+  print('{:24s} {:>10s} {:>10s}'.format('bytes', 'before', 'after'))
+  for (name, before, after) in rows:
+    print('{:24s} {:10.0f} {:10.0f}'.format(name, allocated(before), allocated(after)))
+
+  # the cards of a deck, views of one CardState with and without __dict__
+  before_cards = allocated(lambda: make_cards(DictCardView), count=50)
+  after_cards = allocated(lambda: make_cards(Card.view), count=50)
+  print('{:24s} {:10.0f} {:10.0f}'.format('deck card', before_cards / num_cards, after_cards / num_cards))
+
+  # a game with dict-backed deck cards is estimated from the measured game, its cards swapped
+  per_game = allocated(make_game, count=50)
+  before_game = per_game - after_cards + before_cards
+  print('{:24s} {:10.0f} {:10.0f}   ({} players, {} cards, before estimated)'.format(
+    'game', before_game, per_game, num_players, num_cards))
+  print('{:24s} {:10.0f} {:10.0f}'.format('game, per card', before_game / num_cards, per_game / num_cards))
+
+
+if __name__ == '__main__':
+  args = sys.argv[1:]
+  if args:
+    main(int(args[0]), int(args[1]))
+  else:
+    main()
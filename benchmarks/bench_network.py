@@ -0,0 +1,99 @@
+import sys
+import time
+
+import numpy as np
+
+from rftg.network import Network, active_inputs
+
+# Compare evaluating positions one row at a time with a single batched
+# forward pass, and check both against the node by node compute_net().
+# The sparse paths, which take the indices of the active inputs, are
+# checked against the dense ones and timed the same way.
+#
+#   python -m benchmarks.bench_network [kind expansion players]
+
+
+def random_inputs(network, num_rows, density=0.05, seed=0):
+  rng = np.random.default_rng(seed)
+  return (rng.random((num_rows, network.num_input)) < density).astype(np.float32)
+
+
+def time_per_row(network, X):
+  start = time.perf_counter()
+  for x in X:
+    network.forward(x)
+  return time.perf_counter() - start
+
+
+def time_batch(network, X):
+  start = time.perf_counter()
+  network.forward_batch(X)
+  return time.perf_counter() - start
+
+
+def check_against_reference(network, X, tolerance=1e-5):
+  batch = network.forward_batch(X)
+  deviation = 0.0
+  for row in range(len(X)):
+    reference = network.compute_net(X[row])
+    deviation = max(deviation, float(np.abs(batch[row] - reference).max()))
+  if deviation > tolerance:
+    raise AssertionError('batched output deviates by {} (tolerance {})'.format(deviation, tolerance))
+  return deviation
+
+
+def time_sparse_per_row(network, positions):
+  start = time.perf_counter()
+  for active in positions:
+    network.forward_sparse(active)
+  return time.perf_counter() - start
+
+
+def time_sparse_batch(network, positions):
+  start = time.perf_counter()
+  network.forward_sparse_batch(positions)
+  return time.perf_counter() - start
+
+
+def check_sparse(network, X, tolerance=1e-5):
+  # sparse and dense paths agree, one row at a time and batched
+  positions = active_inputs(X)
+  dense = network.forward_batch(X)
+  deviation = float(np.abs(network.forward_sparse_batch(positions) - dense).max())
+  for row in range(len(X)):
+    deviation = max(deviation, float(np.abs(network.forward_sparse(positions[row]) - dense[row]).max()))
+  if deviation > tolerance:
+    raise AssertionError('sparse output deviates by {} (tolerance {})'.format(deviation, tolerance))
+  return deviation
+
+
+def main(kind='eval', expansion=3, players=6):
+  network = Network().load_net(kind, expansion, players)
+  print(repr(network))
+
+  deviation = check_against_reference(network, random_inputs(network, 16))
+  print('max deviation from compute_net: {:.3g}'.format(deviation))
+  X = random_inputs(network, 256)
+  X[0] = 0
+  deviation = check_sparse(network, X)
+  print('max deviation of the sparse paths: {:.3g}'.format(deviation))
+
+  for num_rows in (1, 16, 256, 4096):
+    X = random_inputs(network, num_rows)
+    per_row = time_per_row(network, X)
+    batch = time_batch(network, X)
+    print('{:5d} rows: per-row {:9.0f} rows/s, batched {:9.0f} rows/s ({:.1f}x)'.format(
+      num_rows, num_rows / per_row, num_rows / batch, per_row / batch))
+    positions = active_inputs(X)
+    sparse_per_row = time_sparse_per_row(network, positions)
+    sparse_batch = time_sparse_batch(network, positions)
+    print('      sparse: per-row {:9.0f} rows/s ({:.1f}x), batched {:9.0f} rows/s ({:.1f}x)'.format(
+      num_rows / sparse_per_row, per_row / sparse_per_row, num_rows / sparse_batch, batch / sparse_batch))
+
+
+if __name__ == '__main__':
+  args = sys.argv[1:]
+  if args:
+    main(args[0], int(args[1]), int(args[2]))
+  else:
+    main()
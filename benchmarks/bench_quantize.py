@@ -0,0 +1,75 @@
+import argparse
+import time
+
+import numpy as np
+
+from rftg.network import Network, NETWORK_PATH, PRECISIONS, network_name, quantize
+from rftg.training import load_trajectories
+from benchmarks.bench_network import random_inputs
+
+# Accuracy, size and speed of the quantized networks against the float64
+# weights of the text file. For eval networks the deviation is that of the
+# win probabilities, for role networks that of the role probabilities, with
+# the share of positions whose most likely role changes.
+#
+#   python -m benchmarks.bench_quantize eval 2 4 --positions games.npz
+#   python -m benchmarks.bench_quantize role 0 2 --rows 4096
+
+
+def load_positions(filename):
+  # positions of every game of a save_trajectories() file
+  return np.concatenate([ positions for (positions, outcome) in load_trajectories(filename) ]).astype(np.float32)
+
+
+def deviation(reference, network, X):
+  output = network.forward_batch(X)
+  error = np.abs(output - reference)
+  return {
+    'max': float(error.max()),
+    'mean': float(error.mean()),
+    'argmax_changed': float(np.mean(output.argmax(axis=1) != reference.argmax(axis=1))),
+  }
+
+
+def report(reference_network, X, precisions=PRECISIONS):
+  """ {precision: deviation, bytes and seconds per row} of each precision
+  of reference_network (float64) over the positions X.
+  """
+  reference = reference_network.forward_batch(X)
+  results = {}
+  for precision in precisions:
+    network = quantize(reference_network, precision)
+    result = deviation(reference, network, X)
+    result['bytes'] = network.nbytes
+    start = time.perf_counter()
+    network.forward_batch(X)
+    result['seconds_per_row'] = (time.perf_counter() - start) / len(X)
+    results[precision] = result
+  return results
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Report the deviation of quantized networks from float64.')
+  parser.add_argument('kind', nargs='?', default='eval')
+  parser.add_argument('expansion', nargs='?', type=int, default=3)
+  parser.add_argument('players', nargs='?', type=int, default=6)
+  parser.add_argument('--advanced', action='store_true')
+  parser.add_argument('--positions', help='save_trajectories() file of recorded positions (random inputs otherwise)')
+  parser.add_argument('--rows', type=int, default=1024, help='random positions when none are recorded')
+  parser.add_argument('--path', default=NETWORK_PATH)
+  args = parser.parse_args(argv)
+
+  network = Network(args.kind, args.expansion, args.players, args.advanced)
+  network.read_text('{}/{}'.format(args.path, network_name(args.kind, args.expansion, args.players, args.advanced)))
+  X = load_positions(args.positions) if args.positions else random_inputs(network, args.rows)
+  print('{} on {} positions'.format(repr(network), len(X)))
+
+  changed = 'role changed' if args.kind == 'role' else 'winner changed'
+  print('{:8s} {:>10s} {:>10s} {:>14s} {:>10s} {:>10s}'.format('', 'max dev', 'mean dev', changed, 'KiB', 'us/row'))
+  for (precision, result) in report(network, X).items():
+    print('{:8s} {:10.2e} {:10.2e} {:13.3%} {:10.1f} {:10.3f}'.format(precision, result['max'], result['mean'],
+      result['argmax_changed'], result['bytes'] / 1024, result['seconds_per_row'] * 1e6))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,49 @@
+import copy
+import sys
+import timeit
+
+from rftg.enums import *
+from rftg.cards import Library, ImageMode
+from rftg.game import GameResource, Game, Player
+
+# Time Game.snapshot()/restore() for search rollouts, against deep copying
+# the deck and players (the library is shared and never copied).
+#
+#   python -m benchmarks.bench_snapshot [num_players expansion]
+
+
+def make_game(num_players=4, expansion=2):
+  library = Library()
+  library.setup(images=ImageMode.NONE)
+  players = [ Player(name='Player {}'.format(i), ai=True) for i in range(num_players) ]
+  game = Game(resource=GameResource(library=library), players=players, start_seed=1)
+  game.deck.build_deck(expansion)
+  game.shuffle_deck()
+  for player_index in range(num_players):
+    cards = game.deck.draw_cards(6, player_index=player_index)
+    game.set_player_cards(player_index, cards[:2], Location.ACTIVE)
+  return game
+
+
+def main(num_players=4, expansion=2, number=20000):
+  game = make_game(num_players, expansion)
+  snapshot = game.snapshot()
+  print('{} cards, {} players, snapshot {} bytes packed'.format(
+    len(game.deck.cards), num_players, snapshot.nbytes))
+
+  take = timeit.timeit(game.snapshot, number=number) / number
+  restore = timeit.timeit(lambda: game.restore(snapshot), number=number) / number
+  library = game.resource.library
+  deepcopy = timeit.timeit(lambda: copy.deepcopy((game.deck, game.players), memo={ id(library): library }),
+    number=number // 20) / (number // 20)
+  print('snapshot {:8.1f} us'.format(take * 1e6))
+  print('restore  {:8.1f} us'.format(restore * 1e6))
+  print('deepcopy {:8.1f} us (deck and players, library shared)'.format(deepcopy * 1e6))
+
+
+if __name__ == '__main__':
+  args = sys.argv[1:]
+  if args:
+    main(int(args[0]), int(args[1]))
+  else:
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from rftg.enums import *
+from rftg.cards import Library, ImageMode, Deck
+from rftg.game import GameResource
+from rftg.network import Network, NETWORK_PATH, BINARY_SUFFIX, active_inputs, convert_net, is_binary_current
+from rftg.engine import play_game
+from benchmarks.bench_network import random_inputs
+
+# Benchmarks of the hot paths, written as JSON for comparison against a
+# baseline run. Every metric is seconds per operation (lower is better),
+# the best of a few repeats to keep noise out.
+#
+#   python -m benchmarks.suite --output results.json
+#   python -m benchmarks.suite --baseline results.json --threshold 0.2   # exit 1 on regressions
+#   python -m benchmarks.suite --only deck.
+
+REPEAT = 5
+
+
+def best_time(function, number=1, repeat=REPEAT):
+  # best seconds per call of function over repeat runs of number calls
+  best = float('inf')
+  for run in range(repeat):
+    start = time.perf_counter()
+    for call in range(number):
+      function()
+    best = min(best, (time.perf_counter() - start) / number)
+  return best
+
+
+def bench_library(results, path):
+  def setup(images, cache):
+    Library().setup(path, cache=cache, images=images)
+
+  results['library.setup.none'] = best_time(lambda: setup(ImageMode.NONE, True))
+  results['library.setup.none.nocache'] = best_time(lambda: setup(ImageMode.NONE, False))
+  results['library.setup.lazy'] = best_time(lambda: setup(ImageMode.LAZY, True))
+  results['library.setup.eager'] = best_time(lambda: setup(ImageMode.EAGER, True), repeat=1)
+
+
+def bench_deck(results, library):
+  expansions = sorted(set(design.expansion.index for design in library.designs))
+  for expansion in expansions:
+    deck = Deck(library)
+    results['deck.build_deck.{}'.format(expansion)] = best_time(lambda: deck.build_deck(expansion), number=20)
+
+  deck = Deck(library)
+  deck.build_deck(expansions[-1])
+
+  def draw_all():
+    deck.build_deck(expansions[-1])
+    deck.shuffle_cards()
+    while deck.has_cards(1):
+      deck.draw_cards(1, Location.HAND, 0)
+
+  def pick_all():
+    deck.build_deck(expansions[-1])
+    deck.shuffle_cards()
+    for card in list(deck.cards):
+      deck.pick_cards([ card ], Location.HAND, 1)
+
+  num_cards = len(deck.cards)
+  build = best_time(lambda: (deck.build_deck(expansions[-1]), deck.shuffle_cards()), number=10)
+  results['deck.draw_cards'] = max(0.0, best_time(draw_all) - build) / num_cards
+  results['deck.pick_cards'] = max(0.0, best_time(pick_all) - build) / num_cards
+
+  deck.build_deck(expansions[-1])
+  deck.shuffle_cards()
+  for player_index in range(4):
+    deck.draw_cards(10, Location.HAND, player_index)
+
+  def query():
+    for player_index in range(4):
+      deck.get_cards_by_player_location(player_index, Location.HAND)
+
+  results['deck.get_cards_by_player_location'] = best_time(query, number=1000) / 4
+
+
+def bench_networks(results, network_path):
+  filenames = sorted((os.path.join(network_path, name) for name in os.listdir(network_path) if name.endswith('.net')),
+    key=os.path.getsize)
+  if not filenames:
+    return
+  # smallest, median and largest networks
+  for filename in sorted(set([ filenames[0], filenames[len(filenames) // 2], filenames[-1] ])):
+    name = os.path.basename(filename)[len('rftg.'):-len('.net')]
+    results['network.read_text.{}'.format(name)] = best_time(lambda: Network().read_text(filename), repeat=3)
+    binary_filename = filename + BINARY_SUFFIX
+    if not is_binary_current(filename, binary_filename):
+      convert_net(filename, binary_filename)
+    results['network.read_binary.{}'.format(name)] = best_time(lambda: Network().read_binary(binary_filename))
+
+  network = Network()
+  network.read_text(filenames[-1])
+  X = random_inputs(network, 256)
+  results['network.forward.single'] = best_time(lambda: network.forward(X[0]), number=200)
+  results['network.forward.batch256'] = best_time(lambda: network.forward_batch(X), number=20) / len(X)
+  positions = active_inputs(X)
+  results['network.forward_sparse.single'] = best_time(lambda: network.forward_sparse(positions[0]), number=200)
+
+
+def bench_games(results, library, num_games=20):
+  resource = GameResource(library=library)
+  for num_players in range(2, 7):
+    expansion = max(0, num_players - 4)
+    results['game.{}p'.format(num_players)] = best_time(
+      lambda: play_game(resource, num_players, expansion, 0), number=num_games, repeat=3)
+
+
+def run(path='.', network_path=NETWORK_PATH, only=None):
+  results = {}
+  # metric names start with their suite
+  selected = lambda suite: only is None or any(prefix.split('.')[0] == suite for prefix in only)
+
+  if selected('library'):
+    bench_library(results, path)
+  library = Library()
+  library.setup(path, images=ImageMode.NONE)
+  if selected('deck'):
+    bench_deck(results, library)
+  if selected('network'):
+    bench_networks(results, network_path)
+  if selected('game'):
+    bench_games(results, library)
+  if only:
+    results = { name: value for (name, value) in results.items() if any(name.startswith(prefix) for prefix in only) }
+  return results
+
+
+def compare(results, baseline, threshold):
+  """ (metric, baseline, result, ratio) of the metrics more than threshold
+  (a fraction) slower than the baseline.
+  """
+  regressions = []
+  for (name, value) in sorted(results.items()):
+    base = baseline.get(name)
+    if base and value > base * (1 + threshold):
+      regressions.append((name, base, value, value / base))
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark the hot paths, optionally against a baseline.')
+  parser.add_argument('--output', help='write the results to this JSON file')
+  parser.add_argument('--baseline', help='JSON results to compare against')
+  parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown as a fraction (default 0.2)')
+  parser.add_argument('--only', action='append', help='metric name prefix to run (library, deck., game.4p, ...)')
+  parser.add_argument('--path', default='.', help='directory of cards.txt and card_images')
+  parser.add_argument('--network-path', default=NETWORK_PATH)
+  args = parser.parse_args(argv)
+
+  results = run(args.path, args.network_path, args.only)
+  for (name, value) in sorted(results.items()):
+    print('{:45s} {:12.3f} us'.format(name, value * 1e6))
+
+  if args.output:
+    report = {
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'machine': platform.machine(),
+      'results': results,
+    }
+    with open(args.output, 'w') as fp:
+      json.dump(report, fp, indent=1, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as fp:
+      baseline = json.load(fp)['results']
+    regressions = compare(results, baseline, args.threshold)
+    for (name, base, value, ratio) in regressions:
+      print('REGRESSION {}: {:.3f} us -> {:.3f} us ({:+.0%})'.format(name, base * 1e6, value * 1e6, ratio - 1))
+    if regressions:
+      return 1
+    print('no regression over {:.0%} against {}'.format(args.threshold, args.baseline))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -1,11 +1,86 @@
+import functools
+import hashlib
 import os
+import pickle
 import random
+from array import array
+from collections import OrderedDict
+from enum import Enum
+
+import numpy as np
 
 from .enums import *
 from marshmallow import Schema, fields, post_load
 from marshmallow_enum import EnumField
 
-import matplotlib.image as mpimg
+
+def read_image(filename):
+  # matplotlib is only imported once an image is needed, headless workers never pay for it
+  import matplotlib.image as mpimg
+  return mpimg.imread(filename)
+
+
+def slot_vars(obj):
+  # vars() for objects with __slots__, leaving out attributes never set
+  return { name: getattr(obj, name) for name in obj.__slots__ if hasattr(obj, name) }
+
+
+def flag_mask(flags):
+  """ Integer bitmask of a CardFlag, a list of CardFlag or an existing mask. """
+  if isinstance(flags, CardFlag):
+    return 1 << flags.value
+  if isinstance(flags, (int, np.integer)):
+    return int(flags)
+  mask = 0
+  for flag in flags:
+    mask |= 1 << flag.value
+  return mask
+
+
+class ImageMode(Enum):
+  EAGER = 0   # decode every card image at setup
+  LAZY  = 1   # decode on first access, through a bounded ImageCache
+  NONE  = 2   # headless, no images at all
+
+
+class ImageCache:
+
+  def __init__(self, max_images=32):
+    self.max_images = max_images
+    self.images = OrderedDict()
+
+  def __repr__(self):
+    return '<ImageCache {}/{}>'.format(len(self.images), self.max_images)
+
+  def read(self, filename):
+    image = self.images.get(filename)
+    if image is not None:
+      self.images.move_to_end(filename)
+      return image
+    image = read_image(filename)
+    self.images[filename] = image
+    # least recently used images are decoded again when needed
+    while len(self.images) > self.max_images:
+      self.images.popitem(last=False)
+    return image
+
+  def clear(self):
+    self.images.clear()
+
+
+class LazyImage:
+  # image attribute that can be decoded on first access, see Library.setup
+  image_loader = None
+
+  @property
+  def image(self):
+    if self._image is None and self.image_loader is not None:
+      return self.image_loader()
+    return self._image
+
+  @image.setter
+  def image(self, image):
+    self._image = image
 
 class Power:
 
@@ -21,19 +96,23 @@ class Power:
 
   serializer = Serializer()
 
+  # value and times are only set for powers that have them
+  __slots__ = ('phase', 'code', 'value', 'times')
+
   @staticmethod
   def from_json(json):
     return Power.serializer.load(json)
 
   def __init__(self, **kwargs):
     # lazy way to take all the keyword parameters
-    self.__dict__.update(kwargs)
+    for (name, value) in kwargs.items():
+      setattr(self, name, value)
 
   def __repr__(self):
     return '<Power {}/{}>'.format(self.phase, self.code)
 
   def __str__(self):
-    return self.__class__.__name__ + ':' + str(vars(self))
+    return self.__class__.__name__ + ':' + str(slot_vars(self))
 
   def to_json(self):
     return self.__class__.serializer.dump(self)
@@ -49,20 +128,57 @@ class PowerWhere:
     def make_self(self, data, **kwargs):
       return PowerWhere(**data)
 
+  serializer = Serializer()
+
+  __slots__ = ('card', 'power')
+
   def __init__(self, **kwargs):
     # lazy way to take all the keyword parameters
-    self.__dict__.update(kwargs)
-  
+    for (name, value) in kwargs.items():
+      setattr(self, name, value)
+
   def __repr__(self):
     return '<PowerWhere {}/{}>'.format(self.card, self.power)
 
   def __str__(self):
-    return self.__class__.__name__ + ':' + str(vars(self))
+    return self.__class__.__name__ + ':' + str(slot_vars(self))
 
   def to_json(self):
     return self.__class__.serializer.dump(self)
 
 
+class PowerTable:
+  """ Powers of one phase for every design, flattened into integer arrays.
+  The powers of design d are entries offsets[d] to offsets[d+1], each with
+  its PhasePower code number, value, times and index in design.powers.
+  """
+
+  __slots__ = ('phase', 'offsets', 'code', 'value', 'times', 'power')
+
+  def __init__(self, phase, designs):
+    self.phase = phase
+    offsets = [ 0 ]
+    entries = []
+    for design in designs:
+      for (index, power) in enumerate(design.powers):
+        if power.phase == phase:
+          entries.append((power.code.value[1], getattr(power, 'value', 0), getattr(power, 'times', 0), index))
+      offsets.append(len(entries))
+    (code, value, times, power) = zip(*entries) if entries else ((), (), (), ())
+    self.offsets = np.array(offsets, dtype=np.int32)
+    self.code = np.array(code, dtype=np.int16)
+    self.value = np.array(value, dtype=np.int16)
+    self.times = np.array(times, dtype=np.int16)
+    self.power = np.array(power, dtype=np.int16)
+
+  def __repr__(self):
+    return '<PowerTable {}/{}>'.format(self.phase, len(self.code))
+
+  def entries(self, design_index):
+    # range of entries holding the powers of a design
+    return range(self.offsets[design_index], self.offsets[design_index + 1])
+
+
 class Bonus:
 
   class Serializer(Schema):
@@ -76,6 +192,8 @@ class Bonus:
 
   serializer = Serializer()
 
+  __slots__ = ('point', 'type', 'name')
+
   @staticmethod
   def from_json(json):
     return Bonus.serializer.load(json)
@@ -89,7 +207,7 @@ class Bonus:
     return '<Bonus {}/{}/{}>'.format(self.point, self.type, self.name)
 
   def __str__(self):
-    return self.__class__.__name__ + ':' + str(vars(self))
+    return self.__class__.__name__ + ':' + str(slot_vars(self))
 
   def to_json(self):
     return self.__class__.serializer.dump(self)
@@ -103,19 +221,22 @@ class CardExpansion:
 
     @post_load
     def make_self(self, data, **kwargs):
-      return Bonus(**data)
+      return CardExpansion(**data)
 
   serializer = Serializer()
 
+  __slots__ = ('index', 'count')
+
   def __init__(self, **kwargs):
     # lazy way to take all the keyword parameters
-    self.__dict__.update(kwargs)
+    for (name, value) in kwargs.items():
+      setattr(self, name, value)
 
   def __repr__(self):
     return '<CardExpansion {}/{}>'.format(self.index, self.count)
 
   def __str__(self):
-    return self.__class__.__name__ + ':' + str(vars(self))
+    return self.__class__.__name__ + ':' + str(slot_vars(self))
 
   def to_json(self):
     return self.__class__.serializer.dump(self)
@@ -168,7 +289,7 @@ class Expansion:
     return self.__class__.serializer.dump(self)
 
 
-class ActionDesign:
+class ActionDesign(LazyImage):
 
   class Serializer(Schema):
     name = fields.Str()
@@ -201,7 +322,7 @@ class ActionDesign:
 
 
 
-class Design:
+class Design(LazyImage):
 
   class Serializer(Schema):
     name = fields.Str()
@@ -249,6 +370,8 @@ class Design:
       self.flags = flags
     else:
       self.flags = []
+    # flags as a bitmask, the list is kept for compatibility
+    self.flag_mask = flag_mask(self.flags)
     if powers:
       self.powers = powers
     else:
@@ -273,6 +396,128 @@ class Design:
     return self.__class__.serializer.dump(self)
 
 
+# Location by its value, for card views over CardState.location
+LOCATIONS = tuple(sorted(Location, key=lambda location: location.value))
+ACTIVE = Location.ACTIVE.value
+
+
+class CardState:
+  """ Structure-of-arrays state of the cards in a deck, indexed by card slot.
+  Deck queries are answered with vectorized masks over these columns, or
+  from the (owner, location) index that every owner and location change
+  goes through.
+  """
+
+  def __init__(self, size=0):
+    self.design = np.zeros(size, dtype=np.int16)      # index to library card designs
+    self.owner = np.full(size, -1, dtype=np.int8)
+    self.location = np.zeros(size, dtype=np.int8)     # Location value
+    self.order = np.zeros(size, dtype=np.int16)       # order played on the table
+    self.num_goods = np.zeros(size, dtype=np.int8)    # number of goods placed on the card
+    self.covering = np.zeros(size, dtype=np.int8)     # card we are covering (if a good)
+    self.cost_keys = [ (0, 0) ] * size                # (type, cost) of the card design
+    self.on_move = None   # called with (slot, old_key, new_key) for each owner/location change
+    self.reindex()
+
+  def __repr__(self):
+    return '<CardState {}>'.format(len(self))
+
+  def __len__(self):
+    return len(self.design)
+
+  def set_designs(self, designs):
+    self.design[:] = [ design.index for design in designs ]
+    self.cost_keys = [ (design.type.value, design.cost) for design in designs ]
+    self._views = {}
+
+  # snapshot of the mutable columns, design and cost keys never change
+  def pack(self):
+    return b''.join([ self.owner.tobytes(), self.location.tobytes(), self.order.tobytes(),
+      self.num_goods.tobytes(), self.covering.tobytes() ])
+
+  def unpack(self, buffer, members=None):
+    size = len(self)
+    self.owner[:] = np.frombuffer(buffer, dtype=np.int8, count=size, offset=0)
+    self.location[:] = np.frombuffer(buffer, dtype=np.int8, count=size, offset=size)
+    self.order[:] = np.frombuffer(buffer, dtype=np.int16, count=size, offset=2 * size)
+    self.num_goods[:] = np.frombuffer(buffer, dtype=np.int8, count=size, offset=4 * size)
+    self.covering[:] = np.frombuffer(buffer, dtype=np.int8, count=size, offset=5 * size)
+    if members is None:
+      self.reindex()
+    else:
+      self.members = { key: slots.copy() for (key, slots) in members.items() }
+      self._views = {}
+
+  def copy_members(self):
+    return { key: slots.copy() for (key, slots) in self.members.items() }
+
+  # (owner, location) index
+  def reindex(self):
+    # rebuild the index from the owner and location columns
+    self.members = {}   # (owner, location) -> slots, as an insertion ordered dict
+    self._views = {}    # (owner, location) -> sorted slot lists, dropped on change
+    for (slot, key) in enumerate(zip(self.owner.tolist(), self.location.tolist())):
+      self.members.setdefault(key, {})[slot] = None
+
+  def move(self, slots, owner=None, location=None):
+    """ Set the owner and/or location (value) of the slots, keeping the index. """
+    slots = list(dict.fromkeys(slots))
+    if not slots:
+      return
+    members = self.members
+    views = self._views
+    on_move = self.on_move
+    owners = self.owner
+    locations = self.location
+    # moves are a handful of cards, scalar access beats fancy indexing here
+    for slot in slots:
+      old_key = (owners.item(slot), locations.item(slot))
+      new_key = (old_key[0] if owner is None else owner, old_key[1] if location is None else location)
+      if new_key != old_key:
+        del members[old_key][slot]
+        members.setdefault(new_key, {})[slot] = None
+        views.pop(old_key, None)
+        views.pop(new_key, None)
+        owners[slot] = new_key[0]
+        locations[slot] = new_key[1]
+        if on_move is not None:
+          on_move(slot, old_key, new_key)
+
+  def set_order(self, slot, order):
+    self.order[slot] = order
+    self._views.pop((int(self.owner[slot]), int(self.location[slot])), None)
+
+  def _view(self, owner, location):
+    key = (owner, location)
+    view = self._views.get(key)
+    if view is None:
+      view = self._views[key] = {}
+    return (view, self.members.get(key, ()))
+
+  def slots_at(self, owner, location):
+    # slots in slot order
+    (view, members) = self._view(owner, location)
+    if 'slot' not in view:
+      view['slot'] = sorted(members)
+    return view['slot']
+
+  def slots_by_cost(self, owner, location):
+    # worlds then developments, each by cost, ties in slot order
+    (view, members) = self._view(owner, location)
+    if 'cost' not in view:
+      cost_keys = self.cost_keys
+      view['cost'] = sorted(members, key=lambda slot: (cost_keys[slot], slot))
+    return view['cost']
+
+  def slots_by_order(self, owner, location):
+    # by order played, ties in slot order
+    (view, members) = self._view(owner, location)
+    if 'order' not in view:
+      order = self.order.tolist()
+      view['order'] = sorted(members, key=lambda slot: (order[slot], slot))
+    return view['order']
+
+
 class Card:
 
   class Serializer(Schema):
@@ -290,6 +535,13 @@ class Card:
 
   serializer = Serializer()
 
+  # a deck's cards are CardViews of its CardState, see view(); a card built
+  # on its own is a LooseCard, which holds its fields
+  __slots__ = ('name',)
+
+  def __new__(cls, *args, **kwargs):
+    return object.__new__(LooseCard if cls is Card else cls)
+
   def __init__(self, index=0, name='', covering=False, num_goods=0, owner=-1, location=Location.DECK, order=0):
     self.index = index # index to library card designs
     self.name = name # dup of design name
@@ -299,11 +551,22 @@ class Card:
     self.location = location # card location
     self.order = order # order played on the table
 
+  @staticmethod
+  def view(state, slot, name=''):
+    # card backed by the given slot of a deck's CardState
+    card = object.__new__(CardView)
+    card._state = state
+    card._slot = slot
+    card.name = name
+    return card
+
   def __repr__(self):
     return '<Card {}/{}/{}/{}>'.format(self.index, self.name, self.location, self.owner)
 
   def __str__(self):
-    return self.__class__.__name__ + ':' + str(vars(self))
+    attributes = { name: getattr(self, name)
+      for name in ('index', 'name', 'covering', 'num_goods', 'owner', 'location', 'order') }
+    return self.__class__.__name__ + ':' + str(attributes)
 
   def to_json(self):
     return self.__class__.serializer.dump(self)
@@ -312,12 +575,91 @@ class Card:
     return library.designs[self.index]
 
 
+class CardView(Card):
+  """ Card of a deck: its fields are the columns of the deck's CardState at
+  its slot.
+  """
+
+  __slots__ = ('_state', '_slot')
+
+  @property
+  def slot(self):
+    return self._slot
+
+  @property
+  def index(self):
+    return int(self._state.design[self._slot])
+
+  @index.setter
+  def index(self, index):
+    self._state.design[self._slot] = index
+
+  @property
+  def covering(self):
+    return bool(self._state.covering[self._slot])
+
+  @covering.setter
+  def covering(self, covering):
+    self._state.covering[self._slot] = covering
+
+  @property
+  def num_goods(self):
+    return int(self._state.num_goods[self._slot])
+
+  @num_goods.setter
+  def num_goods(self, num_goods):
+    self._state.num_goods[self._slot] = num_goods
+
+  @property
+  def owner(self):
+    return int(self._state.owner[self._slot])
+
+  @owner.setter
+  def owner(self, owner):
+    self._state.move((self._slot,), owner=owner)
+
+  @property
+  def location(self):
+    return LOCATIONS[self._state.location[self._slot]]
+
+  @location.setter
+  def location(self, location):
+    self._state.move((self._slot,), location=location.value)
+
+  @property
+  def order(self):
+    return int(self._state.order[self._slot])
+
+  @order.setter
+  def order(self, order):
+    self._state.set_order(self._slot, order)
+
+
+class LooseCard(Card):
+  """ Card outside of a deck: its fields are plain slots rather than a
+  deck's CardState columns, a few dozen bytes instead of a CardState.
+  """
+
+  __slots__ = ('index', 'covering', 'num_goods', 'owner', 'location', 'order')
+
+  @property
+  def slot(self):
+    return None
+
+
 class Deck:
 
-  def __init__(self, library):
+  def __init__(self, library, rng=None, np_rng=None):
     self.library = library
+    # random generators of this deck, games pass their own to stay reproducible
+    self.random = rng if rng is not None else random.Random()
+    self.np_random = np_rng if np_rng is not None else np.random.default_rng()
     self.cards = []
-    self.order_cards = []
+    self.order_cards = array('h')   # draw pile, card slots with the top card last
+    self.pile_pos = array('h')      # position of each card slot in order_cards, -1 if not in the pile
+    self.pile_removed = 0   # cards picked out of order_cards, left as -1 until compacted
+    self.active_powers = {} # (player, phase) -> PowerWhere list of the player's tableau
+    self.state = CardState()
 
 
   def card_at_pos(self, index):
@@ -325,7 +667,7 @@ class Deck:
 
   def card_pos_by_name(self, card_name):
     index = 0
-    for card in cards:
+    for card in self.cards:
       if card.name == card_name:
         return index
       index += 1
@@ -345,80 +687,122 @@ class Deck:
 
   def clear_deck(self):
     self.cards = []
-    self.order_cards = []
+    self._set_pile([])
+    self.active_powers = {}
+    self.state = CardState()
 
   def build_deck(self, expansion_index):
     self.clear_deck()
-    card_order = 0
+    designs = []
     for design in self.library.designs:
       if design.expansion.index <= expansion_index:
         # skip the promo home world
         if design.index > 5:
           # insert count of cards of a design
-          for i in range(design.expansion.count):
-            card = Card()
-            card.index = design.index
-            card.name = design.name
-            self.cards.append(card)
-            self.order_cards.append(card_order)
-            card_order += 1
-
-  # rebuild deck from discard
+          designs.extend([design] * design.expansion.count)
+
+    self.state = CardState(len(designs))
+    self.state.set_designs(designs)
+    self.state.on_move = self._card_moved
+    self.cards = [ Card.view(self.state, slot, design.name) for (slot, design) in enumerate(designs) ]
+    # the first card on top, as the cards were built
+    self._set_pile(list(range(len(self.cards) - 1, -1, -1)))
+
+  # rebuild deck from discard, under the cards still in the draw pile
   def rebuild_deck(self):
-    self.order_cards = []
-    card_order = 0
-    for card in self.cards:
-      if card.location == Location.DISCARD:
-        card.location = Location.DECK
-        self.order_cards.append(card_order)
-      card_order += 1
+    discard = np.flatnonzero(self.state.location == Location.DISCARD.value).tolist()
+    self.state.move(discard, location=Location.DECK.value)
+    self._set_pile(discard[::-1] + self._pile())
 
   def get_random_start_world_cards(self):
     cards = self.get_cards_with_flags(CardFlag.START)
     self.set_cards_location(cards, location=Location.ASIDE)
-    random.shuffle(cards)
+    self.random.shuffle(cards)
     return cards
 
+  # vectorized selection over the deck's CardState
+  def _slots(self, cards):
+    # slots of the cards, None when some are not cards of this deck (LooseCards
+    # or cards of another deck), which are then filtered by their attributes
+    state = self.state
+    slots = []
+    for card in cards:
+      if type(card) is not CardView or card._state is not state:
+        return None
+      slots.append(card._slot)
+    return np.array(slots, dtype=np.intp)
+
+  def _cards_at(self, slots):
+    cards = self.cards
+    if isinstance(slots, np.ndarray):
+      slots = slots.tolist()
+    return [ cards[slot] for slot in slots ]
+
+  def _select(self, cards, mask, test):
+    # cards from the list where mask(slots) holds, or test(card) for cards
+    # outside the deck, keeping the list's order
+    if cards is self.cards:
+      return self._cards_at(np.flatnonzero(mask(slice(None))))
+    slots = self._slots(cards)
+    if slots is None:
+      return [ card for card in cards if test(card) ]
+    return [ cards[i] for i in np.flatnonzero(mask(slots)).tolist() ]
+
   # find cards in deck
   def get_cards_with_flags(self, match_flag):
-    result_cards = []
-    for card in self.cards:
-      card_flags = self.library.get_card_flags(card.index)
-      if match_flag in card_flags:
-        result_cards.append(card)
-    return result_cards
+    has_flag = self.library.get_designs_with_flag(match_flag)
+    return self._cards_at(np.flatnonzero(has_flag[self.state.design]))
 
-  def get_cards_by_player(self, player_index=-1):
-    result_cards = []
-    for card in self.cards:
-      if card.owner == player_index:
-        result_cards.append(card)
-    return result_cards
+  # flag queries over a card set, flags as a CardFlag, list of CardFlag or mask
+  def get_cards_flag_masks(self, cards):
+    slots = self._slots(cards)
+    if slots is None:
+      return self.library.get_flag_masks()[np.array([ card.index for card in cards ], dtype=np.intp)]
+    return self.library.get_flag_masks()[self.state.design[slots]]
+
+  def _any_flags(self, cards, flags):
+    return (self.get_cards_flag_masks(cards) & flag_mask(flags)) != 0
+
+  def _all_flags(self, cards, flags):
+    mask = flag_mask(flags)
+    return (self.get_cards_flag_masks(cards) & mask) == mask
+
+  def get_cards_with_any_flags(self, cards, flags):
+    return [ cards[i] for i in np.flatnonzero(self._any_flags(cards, flags)).tolist() ]
 
+  def get_cards_with_all_flags(self, cards, flags):
+    return [ cards[i] for i in np.flatnonzero(self._all_flags(cards, flags)).tolist() ]
+
+  def count_cards_with_any_flags(self, cards, flags):
+    return int(np.count_nonzero(self._any_flags(cards, flags)))
+
+  def count_cards_with_all_flags(self, cards, flags):
+    return int(np.count_nonzero(self._all_flags(cards, flags)))
+
+  # from the (owner, location) index, O(size of result)
   def get_cards_by_player_location(self, player_index=-1, location=Location.HAND):
-    result_cards = []
-    for card in self.cards:
-      if card.owner == player_index and card.location == location:
-        result_cards.append(card)
-    return result_cards
+    return self._cards_at(self.state.slots_at(player_index, location.value))
 
+  def get_cards_by_player_location_cost_sorted(self, player_index=-1, location=Location.HAND):
+    return self._cards_at(self.state.slots_by_cost(player_index, location.value))
 
-  # given cards[] to operate
-  def get_cards_design(self, cards):
-    return [ card.get_card_design(self.library) for card in cards ]
+  def get_cards_by_player_location_order_sorted(self, player_index=-1, location=Location.ACTIVE):
+    return self._cards_at(self.state.slots_by_order(player_index, location.value))
 
+
+  # given cards[] to operate
   def set_cards_location(self, cards, location):
-    for card in cards:
-      card.location = location
+    self.state.move([ card.slot for card in cards ], location=location.value)
 
   def set_cards_player(self, cards, player_index):
-    for card in cards:
-      card.owner = player_index
+    self.state.move([ card.slot for card in cards ], owner=player_index)
+
+  def move_cards(self, cards, location, player_index):
+    self.state.move([ card.slot for card in cards ], owner=player_index, location=location.value)
 
   def discard_cards(self, cards):
-    for card in cards:
-      card.location = Location.DISCARD
-      card.owner = -1
+    self.move_cards(cards, Location.DISCARD, -1)
+    self._remove_from_pile(cards)
 
   def has_card_by_index(self, cards, card_index):
     for card in cards:
@@ -427,19 +811,22 @@ class Deck:
     return False
 
   def get_cards_design(self, cards):
-    return [ card.get_card_design(self.library) for card in cards ] 
+    return [ card.get_card_design(self.library) for card in cards ]
 
   def get_cards_by_index(self, cards, card_index=-1):
-    return [ card for card in cards if card.index == card_index ]
+    return self._select(cards, lambda slots: self.state.design[slots] == card_index,
+      lambda card: card.index == card_index)
 
   def get_cards_by_name(self, cards, card_name =''):
     return [ card for card in cards if card.name == card_name ]
 
   def get_cards_by_player(self, cards, player_index=-1):
-    return [ card for card in cards if card.owner == player_index ]
+    return self._select(cards, lambda slots: self.state.owner[slots] == player_index,
+      lambda card: card.owner == player_index)
 
   def get_cards_by_location(self, cards, location=Location.HAND):
-    return [ card for card in cards if card.location == location ]
+    return self._select(cards, lambda slots: self.state.location[slots] == location.value,
+      lambda card: card.location == location)
 
   def get_cards_by_type(self, cards, type=CardType.WORLD):
     return [ card for card in cards if card.get_card_design(self.library).type == type]
@@ -456,62 +843,155 @@ class Deck:
     return cards
 
   def get_cards_by_covering(self, cards):
-    return [ card for card in cards if card.covering ]
+    return self._select(cards, lambda slots: self.state.covering[slots] != 0, lambda card: card.covering)
 
   def get_cards_by_goods(self, cards, good=GoodType.ANY):
     if good == GoodType.ANY:
-      return [ card for card in cards if card.num_goods > 0 ]
+      return self._select(cards, lambda slots: self.state.num_goods[slots] > 0, lambda card: card.num_goods > 0)
     else:
       # if good type is needed, we need to lookup in the card design
-      result_cards = []
-      for card in cards:
-        if card.num_goods > 0:
-          design = self.library.designs[card.index]
-          if design.good == good:
-            result_cards.append(card)
-      return result_cards
+      has_good = self.library.get_designs_with_good(good)
+      return self._select(cards,
+        lambda slots: (self.state.num_goods[slots] > 0) & has_good[self.state.design[slots]],
+        lambda card: card.num_goods > 0 and has_good[card.index])
 
   def get_cards_by_type_sortedx(self, cards):
     world_cards = get_cards_by_type(self, cards, type=CardType.WORLD)
     develop_cards = get_cards_by_type(self, cards, type=CardType.DEVELOPMENT)
 
+  # tableau powers by phase, kept up to date as cards enter or leave Location.ACTIVE
+  def _card_moved(self, slot, old_key, new_key):
+    if old_key[1] == ACTIVE:
+      self._remove_active_powers(slot, old_key[0])
+    if new_key[1] == ACTIVE:
+      self._add_active_powers(slot, new_key[0])
+
+  def _add_active_powers(self, slot, player_index):
+    design_index = int(self.state.design[slot])
+    for phase in range(1, 6):
+      table = self.library.get_phase_powers(phase)
+      power_where = [ PowerWhere(card=slot, power=power) for power in table.power[table.entries(design_index)].tolist() ]
+      if power_where:
+        self.active_powers.setdefault((player_index, phase), []).extend(power_where)
+
+  def _remove_active_powers(self, slot, player_index):
+    for phase in range(1, 6):
+      power_where = self.active_powers.get((player_index, phase))
+      if power_where:
+        power_where[:] = [ where for where in power_where if where.card != slot ]
+
+  def get_player_powers(self, player_index, phase):
+    # PowerWhere of every power of the phase on the player's tableau
+    return self.active_powers.get((player_index, phase.value if isinstance(phase, Phase) else phase), [])
+
+  def get_power(self, power_where):
+    return self.library.designs[self.cards[power_where.card].index].powers[power_where.power]
+
+  # snapshot of the card state and draw pile, see Game.snapshot
+  def snapshot(self):
+    active_powers = { key: list(power_where) for (key, power_where) in self.active_powers.items() }
+    return (self.state.pack(), self.state.copy_members(),
+      self.order_cards.tobytes(), self.pile_pos.tobytes(), self.pile_removed,
+      active_powers)
+
+  def restore(self, snapshot):
+    (state, members, order_cards, pile_pos, pile_removed, active_powers) = snapshot
+    self.state.unpack(state, members)
+    self.order_cards = array('h', order_cards)
+    self.pile_pos = array('h', pile_pos)
+    self.pile_removed = pile_removed
+    self.active_powers = { key: list(power_where) for (key, power_where) in active_powers.items() }
+
+  def load(self, state, pile):
+    """ Set the card state (as CardState.pack) and draw pile (card slots,
+    top card last) of a deck built for the same expansion, e.g. from a checkpoint.
+    """
+    self.state.unpack(state)
+    self._set_pile(pile)
+    # tableau powers in the order the cards were played, as when they were placed
+    self.active_powers = {}
+    active = np.flatnonzero((self.state.location == ACTIVE) & (self.state.owner >= 0))
+    for slot in sorted(active.tolist(), key=lambda slot: (self.state.order[slot], slot)):
+      self._add_active_powers(slot, int(self.state.owner[slot]))
+
   # use order_cards stack (sequence)
+  # draws pop from the end, picks leave a -1 behind, so both are O(1)
+  def _set_pile(self, slots):
+    self.order_cards = array('h', slots)
+    self.pile_pos = array('h', [ -1 ]) * len(self.cards)
+    for (pos, slot) in enumerate(slots):
+      self.pile_pos[slot] = pos
+    self.pile_removed = 0
+
+  def _pile(self):
+    # draw pile without the picked cards, top card last
+    return [ slot for slot in self.order_cards if slot >= 0 ]
+
   def find_order_by_card(self, card):
-    for order in range(len(self.order_cards)):
-      if card.index == self.cards[order].index:
-        return order
-    return -1
+    return self.pile_pos[card.slot]
 
   def remain_cards(self):
-    return len(self.order_cards)
-  
+    return len(self.order_cards) - self.pile_removed
+
   def has_cards(self, number=1):
     return self.remain_cards() >= number
 
   def shuffle_cards(self):
-    random.shuffle(self.order_cards)
+    pile = self._pile()
+    self.random.shuffle(pile)
+    self._set_pile(pile)
     return True
 
+  def shuffled_piles(self, count):
+    """ count independent shuffles of the draw pile as a (count, remain_cards)
+    array of card slots, top card last, e.g. to sample hidden draws for rollouts.
+    Drawn with the deck's NumPy generator in one call; the pile is unchanged.
+    """
+    pile = np.array(self._pile(), dtype=np.int16)
+    return self.np_random.permuted(np.broadcast_to(pile, (count, len(pile))), axis=1)
+
+  def set_pile(self, slots):
+    # replace the draw pile order, e.g. by a row of shuffled_piles()
+    slots = slots.tolist() if isinstance(slots, np.ndarray) else list(slots)
+    if sorted(slots) != sorted(self._pile()):
+      raise ValueError('set_pile needs the cards of the current draw pile')
+    self._set_pile(slots)
+
   def pick_cards(self, cards, location=Location.HAND, player_index=-1):
+    self.move_cards(cards, location, player_index)
+    self._remove_from_pile(cards)
+
+  def _remove_from_pile(self, cards):
     for card in cards:
-      card.location = location
-      card.owner = player_index
-      order = self.find_order_by_card(card)
+      order = self.pile_pos[card.slot]
       if order >= 0:
-        self.order_cards.remove(order)
+        self.order_cards[order] = -1
+        self.pile_pos[card.slot] = -1
+        self.pile_removed += 1
+    # compact once most of the pile is picked, keeping picks amortized O(1)
+    if self.pile_removed > len(self.order_cards) // 2:
+      self._set_pile(self._pile())
 
   def draw_cards(self, number=1, location=Location.HAND, player_index=-1):
     result_cards = []
     if self.has_cards(number):
+      order_cards = self.order_cards
       for n in range(number):
-        order = self.order_cards.pop(1)
-        card = self.cards[order]
-        card.location = location 
-        card.owner = player_index
-        result_cards.append(card)
+        slot = order_cards.pop()
+        while slot < 0:
+          self.pile_removed -= 1
+          slot = order_cards.pop()
+        self.pile_pos[slot] = -1
+        result_cards.append(self.cards[slot])
+      self.move_cards(result_cards, location, player_index)
     return result_cards
 
 
+# compiled library cache, rebuilt whenever cards.txt or this version changes
+LIBRARY_CACHE_FILENAME = 'cards.cache'
+LIBRARY_CACHE_VERSION = 1
+
+
 class Library:
 
   def __init__(self, path='.'):
@@ -520,17 +1000,36 @@ class Library:
     self.cur_index = 0
     self.num_designs = 0
     self.lookup = {}
+    self.image_cache = None
+    self._design_masks = {}
 
   def _build_name_lookup(self):
+    self._design_masks = {}
     for design in self.designs:
       self.lookup[design.name.lower()] = design.index
 
-  def setup(self, path='.'):
+  def setup(self, path='.', cache=True, images=ImageMode.EAGER, max_images=32):
+    """ Read the card designs and their images.
+    Simulation workers that never display anything should use ImageMode.NONE;
+    ImageMode.LAZY decodes an image when first used, keeping at most
+    max_images decoded at a time.
+    """
     design_path = os.path.join(path, 'cards.txt')
     image_path = os.path.join(path, 'card_images')
-    self.read_cards(design_path)
-    self.read_card_images(image_path)
-    self.load_actions(image_path)
+    cache_path = os.path.join(path, LIBRARY_CACHE_FILENAME)
+    if not (cache and self.read_cache(cache_path, design_path)):
+      self.read_cards(design_path)
+      if cache:
+        self.write_cache(cache_path, design_path)
+    self.load_actions()
+    self.compile_tables()
+
+    if images == ImageMode.EAGER:
+      self.read_card_images(image_path)
+      self.read_action_card_images(image_path)
+    elif images == ImageMode.LAZY:
+      self.image_cache = ImageCache(max_images)
+      self.set_card_image_loaders(image_path)
 
   def card_by_id(self, card_index):
     return self.designs[card_index]
@@ -539,7 +1038,7 @@ class Library:
     card_index = self.lookup[card_name.lower()]
     return self.designs[card_index]
 
-  def load_actions(self, card_path):
+  def load_actions(self, card_path=None):
     actions = [
       Action.EXPLORE_5_0,
       Action.EXPLORE_1_1,
@@ -549,9 +1048,9 @@ class Library:
       Action.CONSUME_X2,
       Action.PRODUCE
     ]
-    for action in actions:
-      self.action_designs.append( ActionDesign(name=action.name, index=action) )
-    self.read_action_card_images(card_path)
+    self.action_designs = [ ActionDesign(name=action.name, index=action) for action in actions ]
+    if card_path:
+      self.read_action_card_images(card_path)
 
   def action_design_by_id(self, index):
     return self.action_designs[index]
@@ -624,6 +1123,7 @@ class Library:
     flags = items[1].strip().split('|')
     for flag in flags:
       design.flags.append(CardFlag[flag.strip()])
+    design.flag_mask = flag_mask(design.flags)
     
   def parse_good(self, line):
     items = line.split(':')
@@ -666,6 +1166,70 @@ class Library:
     pass
 
 
+  # compiled library cache
+  def _cards_signature(self, cardFilename):
+    with open(cardFilename, 'rb') as fp:
+      digest = hashlib.sha1(fp.read()).hexdigest()
+    return (os.stat(cardFilename).st_mtime_ns, digest)
+
+  def _design_record(self, design):
+    powers = [ (power.code.name, getattr(power, 'value', None), getattr(power, 'times', None))
+      for power in design.powers ]
+    bonuses = [ (bonus.point, bonus.type.value, bonus.name) for bonus in design.bonuses ]
+    return (design.name, design.index, design.type.value, design.cost, design.vp,
+      (design.expansion.index, design.expansion.count), design.good.value,
+      [ flag.value for flag in design.flags ], powers, bonuses, design.source)
+
+  def _design_from_record(self, record):
+    (name, index, type, cost, vp, (expansion_index, expansion_count), good,
+      flags, powers, bonuses, source) = record
+    design = Design(name=name, index=index, type=CardType(type), cost=cost, vp=vp,
+      expansion=CardExpansion(index=expansion_index, count=expansion_count),
+      good=GoodType(good), flags=[ CardFlag(flag) for flag in flags ],
+      bonuses=[ Bonus(point, VP(type), name) for (point, type, name) in bonuses ],
+      source=source)
+    for (code, value, times) in powers:
+      power = Power()
+      power.code = PhasePower[code]
+      power.phase = power.code.value[0]
+      # powers without value and times in cards.txt have no such attributes
+      if value is not None:
+        power.value = value
+        power.times = times
+      design.powers.append(power)
+    return design
+
+  def read_cache(self, cacheFilename, cardFilename):
+    """ Load the designs from the compiled cache, if it was built from
+    the current cards.txt. Returns False when the cache must be rebuilt.
+    """
+    try:
+      with open(cacheFilename, 'rb') as fp:
+        (version, signature, records) = pickle.load(fp)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+      return False
+    if version != LIBRARY_CACHE_VERSION or signature != self._cards_signature(cardFilename):
+      return False
+
+    self.designs = [ self._design_from_record(record) for record in records ]
+    self.num_designs = len(self.designs)
+    self.cur_index = self.num_designs - 1
+    self._build_name_lookup()
+    return True
+
+  def write_cache(self, cacheFilename, cardFilename):
+    records = [ self._design_record(design) for design in self.designs ]
+    cache = (LIBRARY_CACHE_VERSION, self._cards_signature(cardFilename), records)
+    # the cache is only an optimization, a read-only library still works
+    try:
+      temp_filename = '{}.{}.tmp'.format(cacheFilename, os.getpid())
+      with open(temp_filename, 'wb') as fp:
+        pickle.dump(cache, fp, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(temp_filename, cacheFilename)
+    except OSError:
+      pass
+
+
   # card design images
   def card_image_name(self, card_index):
     card_name = '%s%03d' %('card', card_index)
@@ -674,7 +1238,7 @@ class Library:
   def read_card_image(self, card_path, card_index):
     card_name = self.card_image_name(card_index)
     card_filename = '{}/{}.png'.format(card_path, card_name)
-    card_image = mpimg.imread(card_filename)
+    card_image = read_image(card_filename)
     return card_image
 
   def read_card_images(self, card_path):
@@ -690,7 +1254,7 @@ class Library:
   def read_action_card_image(self, card_path, action):
     card_name = self.action_card_image_name(action)
     card_filename = '{}/{}.png'.format(card_path, card_name)
-    card_image = mpimg.imread(card_filename)
+    card_image = read_image(card_filename)
     return card_image
 
   def read_action_card_images(self, card_path):
@@ -699,6 +1263,75 @@ class Library:
       card_image = self.read_action_card_image(card_path, action)
       self.action_designs[index].image = card_image
 
+  # lazy card images, decoded through the image cache on first access
+  def set_card_image_loaders(self, card_path):
+    for design in self.designs:
+      card_filename = '{}/{}.png'.format(card_path, self.card_image_name(design.index))
+      design.image_loader = functools.partial(self.image_cache.read, card_filename)
+    for action_design in self.action_designs:
+      card_filename = '{}/{}.png'.format(card_path, self.action_card_image_name(action_design.index))
+      action_design.image_loader = functools.partial(self.image_cache.read, card_filename)
+
   def get_card_flags(self, card_index):
     design = self.designs[card_index]
     return design.flags
+
+  def get_card_flag_mask(self, card_index):
+    return self.designs[card_index].flag_mask
+
+  # arrays over design index, for vectorized deck queries
+  def get_flag_masks(self):
+    key = 'flag_masks'
+    if key not in self._design_masks:
+      self._design_masks[key] = np.array([ design.flag_mask for design in self.designs ], dtype=np.int64)
+    return self._design_masks[key]
+
+  def get_designs_with_flag(self, flag):
+    key = ('flag', flag)
+    if key not in self._design_masks:
+      self._design_masks[key] = (self.get_flag_masks() & flag_mask(flag)) != 0
+    return self._design_masks[key]
+
+  def compile_tables(self):
+    # build the per-design tables up front, so their cost is not charged to the first game
+    self.get_flag_masks()
+    for phase in range(1, 6):
+      self.get_phase_powers(phase)
+    self.get_power_groups()
+
+  def get_phase_powers(self, phase):
+    # PowerTable of the phase (1 to 5), compiled by setup() or on first use
+    key = ('powers', phase)
+    if key not in self._design_masks:
+      self._design_masks[key] = PowerTable(phase, self.designs)
+    return self._design_masks[key]
+
+  def get_power_groups(self):
+    """ Powers as written on each cards.txt P line, e.g. CONSUME_ANY | GET_VP:1:1.
+    For each design, a list over design.powers holding, at the last power
+    of each line, the (phase, codes, value, times) of the whole line and
+    None elsewhere, so that PowerWhere entries can be mapped to their line.
+    """
+    key = 'power_groups'
+    if key not in self._design_masks:
+      design_groups = []
+      for design in self.designs:
+        groups = []
+        codes = []
+        for power in design.powers:
+          codes.append(power.code)
+          # only the last power of a line has value and times
+          if hasattr(power, 'value'):
+            groups.append((power.phase, frozenset(codes), power.value, power.times))
+            codes = []
+          else:
+            groups.append(None)
+        design_groups.append(groups)
+      self._design_masks[key] = design_groups
+    return self._design_masks[key]
+
+  def get_designs_with_good(self, good):
+    key = ('good', good)
+    if key not in self._design_masks:
+      self._design_masks[key] = np.array([ design.good == good for design in self.designs ], dtype=bool)
+    return self._design_masks[key]
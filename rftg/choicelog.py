@@ -0,0 +1,226 @@
+import os
+import time
+
+import numpy as np
+
+from .game import Game, Player, ReplayDivergence
+from .engine import Engine
+
+# Archive of played games, each stored as its start seed, configuration and
+# the choice log of every player; the engine is deterministic, so that is
+# enough to replay the game. A file is a header followed by records:
+#
+#   magic, version
+#   record: byte length (varint), then varints of
+#     start_seed, expansion, advanced, num_players,
+#     for each player: log length, log ints,
+#     rounds, end_vp of each player
+#
+# Ints are zigzag varints (7 bits per byte, high bit set on all but the
+# last byte), so slots, action values and small counts take one byte.
+
+LOG_MAGIC = b'RFTGLOG\0'
+LOG_VERSION = 1
+BUFFER_SIZE = 1 << 20
+
+
+def encode_varints(values):
+  """ Zigzag varint bytes of a sequence of ints, vectorized. """
+  values = np.asarray(values, dtype=np.int64)
+  zigzag = ((values << 1) ^ (values >> 63)).astype(np.uint64)
+  num_bytes = np.ones(len(zigzag), dtype=np.int64)
+  for shift in range(7, 64, 7):
+    num_bytes += zigzag >= np.uint64(1 << shift)
+  ends = np.cumsum(num_bytes)
+  repeated = np.repeat(zigzag, num_bytes)
+  shifts = (np.arange(len(repeated)) - np.repeat(ends - num_bytes, num_bytes)) * 7
+  data = ((repeated >> shifts.astype(np.uint64)) & np.uint64(0x7f)).astype(np.uint8)
+  data[:-1] |= 0x80
+  data[ends - 1] &= 0x7f
+  return data.tobytes()
+
+
+def decode_varints(data):
+  """ Ints of zigzag varint bytes, vectorized. """
+  data = np.frombuffer(data, dtype=np.uint8)
+  if not len(data):
+    return np.zeros(0, dtype=np.int64)
+  ends = np.flatnonzero(data < 0x80)
+  starts = np.concatenate(([ 0 ], ends[:-1] + 1))
+  shifts = (np.arange(len(data)) - np.repeat(starts, ends - starts + 1)) * 7
+  parts = (data & 0x7f).astype(np.uint64) << shifts.astype(np.uint64)
+  zigzag = np.add.reduceat(parts, starts)
+  return (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+
+
+def _encode_length(length):
+  # unsigned varint of a record length
+  data = bytearray()
+  while length >= 0x80:
+    data.append(length & 0x7f | 0x80)
+    length >>= 7
+  data.append(length)
+  return bytes(data)
+
+
+def _decode_length(data, pos):
+  length = 0
+  shift = 0
+  while True:
+    byte = data[pos]
+    pos += 1
+    length |= (byte & 0x7f) << shift
+    if byte < 0x80:
+      return (length, pos)
+    shift += 7
+
+
+class GameRecord:
+  """ A game as archived in a choice log file. """
+
+  __slots__ = ('start_seed', 'expansion', 'advanced', 'choice_logs', 'rounds', 'scores')
+
+  def __init__(self, start_seed=0, expansion=0, advanced=False, choice_logs=(), rounds=0, scores=()):
+    self.start_seed = start_seed
+    self.expansion = expansion
+    self.advanced = advanced
+    self.choice_logs = list(choice_logs) # flat ints of each player, see Game.log_choice
+    self.rounds = rounds
+    self.scores = list(scores)           # end_vp of each player
+
+  def __repr__(self):
+    return '<GameRecord {}/{}/{}>'.format(self.start_seed, self.expansion, len(self.choice_logs))
+
+  @classmethod
+  def from_game(cls, game):
+    return cls(game.start_seed, game.expanded, game.advanced,
+      [ player.choice_log for player in game.players ], game.round,
+      [ player.end_vp for player in game.players ])
+
+  def encode(self):
+    values = [ self.start_seed, self.expansion, int(self.advanced), len(self.choice_logs) ]
+    for log in self.choice_logs:
+      values.append(len(log))
+      values.extend(log)
+    values.append(self.rounds)
+    values.extend(self.scores)
+    return encode_varints(values)
+
+  @classmethod
+  def decode(cls, data):
+    values = decode_varints(data).tolist()
+    (start_seed, expansion, advanced, num_players) = values[:4]
+    pos = 4
+    choice_logs = []
+    for player_index in range(num_players):
+      length = values[pos]
+      choice_logs.append(values[pos + 1:pos + 1 + length])
+      pos += 1 + length
+    rounds = values[pos]
+    scores = values[pos + 1:pos + 1 + num_players]
+    return cls(start_seed, expansion, bool(advanced), choice_logs, rounds, scores)
+
+
+class ChoiceLogWriter:
+  """ Append game records to a choice log file, buffering them in memory
+  and writing in bulk every buffer_size bytes and on close.
+  """
+
+  def __init__(self, filename, buffer_size=BUFFER_SIZE):
+    self.filename = filename
+    self.buffer_size = buffer_size
+    self.buffer = bytearray()
+    self.count = 0
+    new_file = not os.path.exists(filename) or os.path.getsize(filename) == 0
+    self.fp = open(filename, 'ab')
+    if new_file:
+      self.buffer += LOG_MAGIC + bytes([ LOG_VERSION ])
+
+  def __repr__(self):
+    return '<ChoiceLogWriter {}/{}>'.format(self.filename, self.count)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def write(self, game):
+    record = game if isinstance(game, GameRecord) else GameRecord.from_game(game)
+    data = record.encode()
+    self.buffer += _encode_length(len(data))
+    self.buffer += data
+    self.count += 1
+    if len(self.buffer) >= self.buffer_size:
+      self.flush()
+
+  def flush(self):
+    if self.buffer:
+      self.fp.write(self.buffer)
+      self.buffer = bytearray()
+    self.fp.flush()
+
+  def close(self):
+    if self.fp is not None:
+      self.flush()
+      self.fp.close()
+      self.fp = None
+
+
+def read_records(filename):
+  """ Iterate the game records of a choice log file. """
+  with open(filename, 'rb') as fp:
+    data = fp.read()
+  if data[:len(LOG_MAGIC)] != LOG_MAGIC or data[len(LOG_MAGIC)] != LOG_VERSION:
+    raise ValueError('{}: not a version {} choice log'.format(filename, LOG_VERSION))
+  pos = len(LOG_MAGIC) + 1
+  while pos < len(data):
+    (length, pos) = _decode_length(data, pos)
+    yield GameRecord.decode(data[pos:pos + length])
+    pos += length
+
+
+def replay_game(resource, record, until_round=None):
+  """ Replay a game record without any Decision: every choice comes from
+  the record's choice logs. With until_round, stop once that many rounds
+  are played, leaving the game as it was at the end of that round.
+  """
+  players = [ Player(name='Player {}'.format(i)) for i in range(len(record.choice_logs)) ]
+  game = Game(resource=resource, players=players, expanded=record.expansion,
+    advanced=record.advanced, start_seed=record.start_seed)
+  game.start_replay(record.choice_logs)
+  return Engine(game).play(until_round)
+
+
+def verify_game(resource, record):
+  # replaying must use up every choice and give the recorded result
+  try:
+    game = replay_game(resource, record)
+  except ReplayDivergence:
+    return False
+  return (game.round == record.rounds
+    and [ player.end_vp for player in game.players ] == record.scores
+    and game.replay_pos == [ len(log) for log in record.choice_logs ])
+
+
+if __name__ == '__main__':
+  import sys
+
+  from .cards import Library, ImageMode
+  from .game import GameResource
+
+  # verify every game archived in the given choice log files
+  library = Library()
+  library.setup(images=ImageMode.NONE)
+  resource = GameResource(library=library)
+  for filename in sys.argv[1:]:
+    start = time.perf_counter()
+    count = 0
+    failed = 0
+    for record in read_records(filename):
+      count += 1
+      if not verify_game(resource, record):
+        failed += 1
+        print('{}: game {} does not replay'.format(filename, record.start_seed))
+    elapsed = time.perf_counter() - start
+    print('{}: {} games verified, {} failed, {:.1f} games/s'.format(filename, count, failed, count / elapsed))
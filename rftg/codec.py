@@ -0,0 +1,252 @@
+import json
+import struct
+
+import numpy as np
+
+from .enums import *
+from .game import Game, Player
+from .choicelog import encode_varints, decode_varints
+
+# Bulk codec for game states, for exporting game logs and checkpointing
+# sessions. A whole game (header, players, deck columns and draw pile,
+# random generator states) is encoded in one pass, either as one JSON line
+# or as a binary record; the marshmallow schemas of the model classes are
+# only used for validation. Session ids may be any JSON value (the integers
+# of Game, or the strings of a host), up to 65535 bytes encoded.
+#
+# Binary record:
+#   header (see _header), session id (JSON, utf-8), game scalars
+#     (Game._state), actions selected (int8)
+#   each player: name length, ai, Player._state, actions and previous actions
+#     (count, int8 values), choice log (byte length, zigzag varints)
+#   deck: CardState.pack(), draw pile (int16 slots, top card last)
+#   random state: version, 625 words, gauss flag and value
+#   NumPy generator state: as JSON (utf-8, length prefixed)
+
+CODEC_VERSION = 2
+
+# version, record size, session id bytes, start_seed, expanded, advanced, players, cards, pile, actions selected
+_header = struct.Struct('<BIHiB?HHHB')
+_player = struct.Struct('<H?BBI')       # name length, ai, actions, previous actions, choice log bytes
+_random = struct.Struct('<i625I?d')     # random.Random state: version, words, has gauss_next, gauss_next
+_length = struct.Struct('<I')
+
+
+def _random_to_json(game):
+  (version, words, gauss_next) = game.random.getstate()
+  return [ version, list(words), gauss_next ]
+
+
+def _random_from_json(state):
+  (version, words, gauss_next) = state
+  return (version, tuple(words), gauss_next)
+
+
+def encode_json(game):
+  """ One JSON line (without the newline) of the whole game state. """
+  deck = game.deck
+  state = deck.state
+  record = {
+    'version': CODEC_VERSION,
+    'game': {
+      'session_id': game.session_id,
+      'start_seed': game.start_seed,
+      'expanded': game.expanded,
+      'advanced': game.advanced,
+      'random_seed': game.random_seed,
+      'vp_pool': game.vp_pool,
+      'cur_action': game.cur_action.value,
+      'turn': game.turn,
+      'round': game.round,
+      'game_over': game.game_over,
+      'action_selected': [ action.value for action in game.action_selected ],
+    },
+    'players': [ {
+      'name': player.name,
+      'ai': player.ai,
+      'actions': [ action.value for action in player.actions ],
+      'prev_actions': [ action.value for action in player.prev_actions ],
+      'state': dict(zip(Player.STATE_FIELDS, Player._get_state(player))),
+      'placing': player.placing.value,
+      'choice_log': player.choice_log,
+    } for player in game.players ],
+    'deck': {
+      'owner': state.owner.tolist(),
+      'location': state.location.tolist(),
+      'order': state.order.tolist(),
+      'num_goods': state.num_goods.tolist(),
+      'covering': state.covering.tolist(),
+      'pile': deck._pile(),
+    },
+    'random': _random_to_json(game),
+    'np_random': game.np_random.bit_generator.state,
+  }
+  return json.dumps(record, separators=(',', ':'))
+
+
+def decode_json(line, resource):
+  """ Game of a JSON line from encode_json, with the given resource. """
+  record = json.loads(line)
+  if record['version'] != CODEC_VERSION:
+    raise ValueError('not a version {} game record'.format(CODEC_VERSION))
+  header = record['game']
+  players = []
+  for data in record['players']:
+    player = Player(name=data['name'], ai=data['ai'])
+    for (name, value) in data['state'].items():
+      setattr(player, name, value)
+    player.placing = Location(data['placing'])
+    player.actions = [ Action(value) for value in data['actions'] ]
+    player.prev_actions = [ Action(value) for value in data['prev_actions'] ]
+    player.choice_log = data['choice_log']
+    players.append(player)
+
+  game = _new_game(resource, players, header['session_id'], header['start_seed'], header['expanded'], header['advanced'])
+  game.random_seed = header['random_seed']
+  game.vp_pool = header['vp_pool']
+  game.cur_action = Phase(header['cur_action'])
+  game.turn = header['turn']
+  game.round = header['round']
+  game.game_over = header['game_over']
+  game.action_selected = [ Action(value) for value in header['action_selected'] ]
+
+  deck = record['deck']
+  columns = [ np.array(deck['owner'], dtype=np.int8), np.array(deck['location'], dtype=np.int8),
+    np.array(deck['order'], dtype=np.int16), np.array(deck['num_goods'], dtype=np.int8),
+    np.array(deck['covering'], dtype=np.int8) ]
+  _load_deck(game, b''.join(column.tobytes() for column in columns), deck['pile'])
+  game.random.setstate(_random_from_json(record['random']))
+  game.np_random.bit_generator.state = record['np_random']
+  return game
+
+
+def encode_binary(game):
+  """ Binary record of the whole game state. """
+  deck = game.deck
+  pile = deck._pile()
+  session_id = json.dumps(game.session_id, separators=(',', ':')).encode('utf-8')
+  if len(session_id) > 0xffff:
+    raise ValueError('session id of {} bytes, at most 65535 can be encoded'.format(len(session_id)))
+  parts = [ b'', session_id, game._state.pack(game.random_seed, game.vp_pool, game.cur_action.value,
+    game.turn, game.round, game.game_over),
+    bytes(np.array([ action.value for action in game.action_selected ], dtype=np.int8)) ]
+  for player in game.players:
+    name = player.name.encode('utf-8')
+    choice_log = encode_varints(player.choice_log)
+    parts.append(_player.pack(len(name), player.ai, len(player.actions), len(player.prev_actions), len(choice_log)))
+    parts.append(name)
+    parts.append(player.pack())
+    parts.append(bytes(np.array([ action.value for action in player.actions + player.prev_actions ], dtype=np.int8)))
+    parts.append(choice_log)
+  parts.append(deck.state.pack())
+  parts.append(np.array(pile, dtype='<i2').tobytes())
+  (version, words, gauss_next) = game.random.getstate()
+  parts.append(_random.pack(version, *words, gauss_next is not None, gauss_next or 0.0))
+  np_state = json.dumps(game.np_random.bit_generator.state).encode('utf-8')
+  parts.append(_length.pack(len(np_state)))
+  parts.append(np_state)
+
+  size = _header.size + sum(len(part) for part in parts)
+  parts[0] = _header.pack(CODEC_VERSION, size, len(session_id), game.start_seed, game.expanded,
+    game.advanced, len(game.players), len(deck.cards), len(pile), len(game.action_selected))
+  return b''.join(parts)
+
+
+def decode_binary(data, resource, offset=0):
+  """ (game, next offset) of the binary record at offset in data. """
+  (version, size, session_size, start_seed, expanded, advanced, num_players, num_cards,
+    pile_size, num_selected) = _header.unpack_from(data, offset)
+  if version != CODEC_VERSION:
+    raise ValueError('not a version {} game record'.format(CODEC_VERSION))
+  end = offset + size
+  pos = offset + _header.size
+  session_id = json.loads(bytes(data[pos:pos + session_size]).decode('utf-8'))
+  pos += session_size
+  (random_seed, vp_pool, cur_action, turn, round, game_over) = Game._state.unpack_from(data, pos)
+  pos += Game._state.size
+  action_selected = [ Action(value) for value in np.frombuffer(data, dtype=np.int8,
+    count=num_selected, offset=pos).tolist() ]
+  pos += num_selected
+
+  players = []
+  for player_index in range(num_players):
+    (name_size, ai, num_actions, num_prev_actions, log_size) = _player.unpack_from(data, pos)
+    pos += _player.size
+    player = Player(name=bytes(data[pos:pos + name_size]).decode('utf-8'), ai=ai)
+    pos += name_size
+    player.unpack(bytes(data[pos:pos + Player._state.size]))
+    pos += Player._state.size
+    actions = np.frombuffer(data, dtype=np.int8, count=num_actions + num_prev_actions, offset=pos).tolist()
+    player.actions = [ Action(value) for value in actions[:num_actions] ]
+    player.prev_actions = [ Action(value) for value in actions[num_actions:] ]
+    pos += num_actions + num_prev_actions
+    player.choice_log = decode_varints(bytes(data[pos:pos + log_size])).tolist()
+    pos += log_size
+    players.append(player)
+
+  game = _new_game(resource, players, session_id, start_seed, expanded, advanced)
+  game.random_seed = random_seed
+  game.vp_pool = vp_pool
+  game.cur_action = Phase(cur_action)
+  game.turn = turn
+  game.round = round
+  game.game_over = game_over
+  game.action_selected = action_selected
+
+  state_size = 6 * num_cards
+  state = bytes(data[pos:pos + state_size])
+  pos += state_size
+  pile = np.frombuffer(data, dtype='<i2', count=pile_size, offset=pos).tolist()
+  pos += 2 * pile_size
+  _load_deck(game, state, pile)
+
+  values = _random.unpack_from(data, pos)
+  pos += _random.size
+  game.random.setstate((values[0], values[1:626], values[627] if values[626] else None))
+  (length,) = _length.unpack_from(data, pos)
+  pos += _length.size
+  game.np_random.bit_generator.state = json.loads(bytes(data[pos:pos + length]).decode('utf-8'))
+  return (game, end)
+
+
+def _new_game(resource, players, session_id, start_seed, expanded, advanced):
+  return Game(resource=resource, players=players, session_id=session_id, start_seed=start_seed,
+    expanded=expanded, advanced=advanced)
+
+
+def _load_deck(game, state, pile):
+  if len(state) != 6 * len(game.deck.cards):
+    raise ValueError('game record deck has {} cards, expansion {} has {}'.format(
+      len(state) // 6, game.expanded, len(game.deck.cards)))
+  game.deck.load(state, pile)
+
+
+CHECKPOINT_MAGIC = b'RFTGSAV\0'
+
+
+def write_jsonl(filename, games):
+  with open(filename, 'w') as fp:
+    fp.write(''.join(encode_json(game) + '\n' for game in games))
+
+
+def read_jsonl(filename, resource):
+  with open(filename, 'r') as fp:
+    for line in fp:
+      if line.strip():
+        yield decode_json(line, resource)
+
+
+def write_binary(filename, games):
+  with open(filename, 'wb') as fp:
+    fp.write(CHECKPOINT_MAGIC + b''.join(encode_binary(game) for game in games))
+
+
+def read_binary(filename, resource):
+  with open(filename, 'rb') as fp:
+    data = memoryview(fp.read())
+  if bytes(data[:len(CHECKPOINT_MAGIC)]) != CHECKPOINT_MAGIC:
+    raise ValueError('{}: not a game checkpoint'.format(filename))
+  pos = len(CHECKPOINT_MAGIC)
+  while pos < len(data):
+    (game, pos) = decode_binary(data, resource, pos)
+    yield game
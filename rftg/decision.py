@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+import asyncio
+import random
 
 from .enums import *
 from .game import Game
@@ -207,3 +209,150 @@ class UIDecision(Decision):
     # who, card_index list, power_where_index
     print(kwargs)
 
+
+
+class RandomDecision(Decision):
+  """ Headless player choosing uniformly among the legal options,
+  for simulations and as a baseline opponent.
+  """
+
+  def __init__(self, game, seed=None):
+    super().__init__(game)
+    self.random = random.Random(seed)
+
+  def init(self, who, factor):
+    pass
+
+  def notify_rotation(self, who):
+    pass
+
+  def prepare_phase(self, who, phase, *args):
+    pass
+
+  def make_choice(self, who, type, **kwargs):
+    rand = self.random
+    if type == Choice.ACTION:
+      return rand.sample(kwargs['actions'], kwargs.get('count', 1))
+    cards = kwargs['cards']
+    if type == Choice.DISCARD:
+      return rand.sample(cards, kwargs['discard'])
+    if type == Choice.PAYMENT:
+      # pay with cards from hand other than the one being placed
+      return rand.sample(cards, kwargs['cost'])
+    if type == Choice.GOOD:
+      return rand.sample(cards, rand.randint(kwargs['min'], kwargs['max']))
+    if type in (Choice.PLACE, Choice.TRADE):
+      # placing and trading are optional, pass now and then
+      if rand.random() < 0.1:
+        return []
+    return [ rand.choice(cards) ]
+
+  def wait_answer(self, who):
+    pass
+
+  def explore_sample(self, who, draw, keep, discard):
+    pass
+
+  def game_over(self, who):
+    pass
+
+  def shutdown(self, who):
+    pass
+
+  def private_message(self, who, msg, tag):
+    pass
+
+
+# abstract class of Decision for asyncio hosts, see rftg.host
+class AsyncDecision(ABC):
+
+  def __init__(self, game: Game):
+    self.game = game
+
+  # Initialize
+  @abstractmethod
+  async def init(self, who, factor):
+    pass
+
+  # Player spots have been rotated
+  @abstractmethod
+  async def notify_rotation(self, who):
+    pass
+
+  # Prepare for a phase
+  @abstractmethod
+  async def prepare_phase(self, who, phase, *args):
+    pass
+
+  # Make a choice among those given
+  @abstractmethod
+  async def make_choice(self, who, type, **kwargs):
+    pass
+
+  # Wait for answer to be ready
+  @abstractmethod
+  async def wait_answer(self, who):
+    pass
+
+  # Take sample cards into hand from Explore phase
+  @abstractmethod
+  async def explore_sample(self, who, draw, keep, discard):
+    pass
+
+  # Game over
+  @abstractmethod
+  async def game_over(self, who):
+    pass
+
+  # Shutdown
+  @abstractmethod
+  async def shutdown(self, who):
+    pass
+
+  # Private message
+  @abstractmethod
+  async def private_message(self, who, msg, tag):
+    pass
+
+
+class ExecutorDecision(AsyncDecision):
+  """ Async wrapper of a blocking Decision, e.g. an AI player. Every call
+  runs in the given executor (the loop's default when None), so that a slow
+  evaluation does not hold up the event loop.
+  """
+
+  def __init__(self, decision, executor=None):
+    super().__init__(decision.game)
+    self.decision = decision
+    self.executor = executor
+
+  async def _run(self, function, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(self.executor, lambda: function(*args, **kwargs))
+
+  async def init(self, who, factor):
+    await self._run(self.decision.init, who, factor)
+
+  async def notify_rotation(self, who):
+    await self._run(self.decision.notify_rotation, who)
+
+  async def prepare_phase(self, who, phase, *args):
+    await self._run(self.decision.prepare_phase, who, phase, *args)
+
+  async def make_choice(self, who, type, **kwargs):
+    return await self._run(self.decision.make_choice, who, type, **kwargs)
+
+  async def wait_answer(self, who):
+    await self._run(self.decision.wait_answer, who)
+
+  async def explore_sample(self, who, draw, keep, discard):
+    await self._run(self.decision.explore_sample, who, draw, keep, discard)
+
+  async def game_over(self, who):
+    await self._run(self.decision.game_over, who)
+
+  async def shutdown(self, who):
+    await self._run(self.decision.shutdown, who)
+
+  async def private_message(self, who, msg, tag):
+    await self._run(self.decision.private_message, who, msg, tag)
@@ -1,16 +1,183 @@
-from PIL import Image
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+import os
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .cards import Card, read_image
+
+
+def _pyplot():
+  # matplotlib is only needed for interactive display, compositing works without it
+  import matplotlib.pyplot as plt
+  return plt
+
+# card images are 372x520, sprites are kept at a third of that
+SPRITE_SIZE = (124, 173)
+ATLAS_FILENAME = 'atlas.{}x{}.npz'
+
+
+def to_rgb8(image):
+  # (height, width, 3) uint8 of an image read by matplotlib (floats in 0..1, maybe RGBA or grey)
+  image = np.asarray(image)
+  if image.dtype != np.uint8:
+    image = (np.clip(image, 0, 1) * 255 + 0.5).astype(np.uint8)
+  if image.ndim == 2:
+    image = np.repeat(image[:, :, None], 3, axis=2)
+  return image[:, :, :3]
+
+
+def composite(images, num_col, labels=None, padding=4, label_height=14, background=(255, 255, 255), size=None):
+  """ One RGB grid of (height, width, 3) uint8 images, num_col per row, in
+  cells of size (width, height) or the largest image, each with an optional
+  label above it.
+  """
+  if size is None:
+    size = (max((image.shape[1] for image in images), default=1), max((image.shape[0] for image in images), default=1))
+  (width, height) = size
+  num_col = max(1, min(num_col, len(images))) if images else 1
+  num_row = max(1, (len(images) + num_col - 1) // num_col)
+  label_height = label_height if labels else 0
+  cell_width = width + padding
+  cell_height = height + label_height + padding
+  grid = np.empty((num_row * cell_height + padding, num_col * cell_width + padding, 3), dtype=np.uint8)
+  grid[:] = background
+
+  for (position, image) in enumerate(images):
+    (row, col) = divmod(position, num_col)
+    top = row * cell_height + padding + label_height
+    left = col * cell_width + padding
+    grid[top:top + image.shape[0], left:left + image.shape[1]] = image
+
+  if labels:
+    image = Image.fromarray(grid)
+    draw = ImageDraw.Draw(image)
+    for (position, label) in enumerate(labels):
+      (row, col) = divmod(position, num_col)
+      draw.text((col * cell_width + padding, row * cell_height + padding), str(label), fill=(0, 0, 0))
+    grid = np.asarray(image)
+  return grid
+
+
+class SpriteAtlas:
+  """ Every card and action image of a directory, decoded once with PIL,
+  scaled to size and stacked into a (num_sprites, height, width, 3) uint8
+  array. The atlas is saved next to the images and loaded from there while
+  it is newer than all of them.
+  """
+
+  def __init__(self, names, sprites):
+    self.names = list(names)
+    self.sprites = sprites
+    self.rows = { name: row for (row, name) in enumerate(self.names) }
+
+  def __repr__(self):
+    return '<SpriteAtlas {}/{}x{}>'.format(len(self.names), self.width, self.height)
+
+  def __len__(self):
+    return len(self.names)
+
+  @property
+  def width(self):
+    return self.sprites.shape[2]
+
+  @property
+  def height(self):
+    return self.sprites.shape[1]
+
+  def sprite(self, name):
+    return self.sprites[self.rows[name]]
+
+  @classmethod
+  def build(cls, cards_path, size=SPRITE_SIZE):
+    names = sorted(os.path.splitext(filename)[0] for filename in os.listdir(cards_path)
+      if filename.endswith('.png') and filename.startswith(('card', 'action')))
+    sprites = np.zeros((len(names), size[1], size[0], 3), dtype=np.uint8)
+    for (row, name) in enumerate(names):
+      with Image.open(os.path.join(cards_path, name + '.png')) as image:
+        sprites[row] = np.asarray(image.convert('RGB').resize(size, Image.LANCZOS))
+    return cls(names, sprites)
+
+  @classmethod
+  def load(cls, cards_path, size=SPRITE_SIZE):
+    filename = os.path.join(cards_path, ATLAS_FILENAME.format(*size))
+    if os.path.exists(filename):
+      atlas_time = os.path.getmtime(filename)
+      if all(os.path.getmtime(os.path.join(cards_path, name)) <= atlas_time
+          for name in os.listdir(cards_path) if name.endswith('.png')):
+        with np.load(filename) as data:
+          return cls(data['names'].tolist(), data['sprites'])
+    atlas = cls.build(cards_path, size)
+    atlas.save(filename)
+    return atlas
+
+  def save(self, filename):
+    # np.savez adds .npz unless the name already ends with it
+    temp_filename = '{}.{}.tmp.npz'.format(filename, os.getpid())
+    np.savez(temp_filename, names=np.array(self.names), sprites=self.sprites)
+    os.replace(temp_filename, filename)
+
+
+class CardCompositor:
+  """ Card grids composited from a SpriteAtlas into one RGB image, with
+  NumPy only. Grids are cached by the tuple of sprites and layout, so
+  redrawing a hand or tableau that has not changed is a lookup.
+  """
+
+  def __init__(self, atlas, padding=4, label_height=14, background=(255, 255, 255), max_grids=256):
+    self.atlas = atlas
+    self.padding = padding
+    self.label_height = label_height
+    self.background = background
+    self.max_grids = max_grids
+    self.grids = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def __repr__(self):
+    return '<CardCompositor {}/{}>'.format(len(self.grids), self.max_grids)
+
+  def compose(self, names, num_col, labels=None):
+    """ Grid of the named sprites, num_col per row, each with an optional
+    label above it. The returned array is shared with the cache, do not modify it.
+    """
+    key = (tuple(names), num_col, tuple(labels) if labels else None)
+    grid = self.grids.get(key)
+    if grid is not None:
+      self.hits += 1
+      self.grids.move_to_end(key)
+      return grid
+    self.misses += 1
+    grid = self._compose(names, num_col, labels)
+    self.grids[key] = grid
+    while len(self.grids) > self.max_grids:
+      self.grids.popitem(last=False)
+    return grid
+
+  def _compose(self, names, num_col, labels):
+    sprites = [ self.atlas.sprite(name) for name in names ]
+    return composite(sprites, num_col, labels, self.padding, self.label_height, self.background,
+      size=(self.atlas.width, self.atlas.height))
+
+  def clear(self):
+    self.grids.clear()
 
-from .cards import Card
 
 class CardDisplay():
 
-  def __init__(self, library, display=None):
+  def __init__(self, library, display=None, compositor=None):
     self.library = library
     self.display = display
     if not display:
       self.display = Display('card_images', figsize=(16,4))
+    self._compositor = compositor
+
+  @property
+  def compositor(self):
+    # the sprite atlas is built (or loaded) on first use
+    if self._compositor is None:
+      self._compositor = CardCompositor(SpriteAtlas.load(self.display.cards_path))
+    return self._compositor
 
   def _get_design_by_any(self, card):
     if isinstance(card, str):
@@ -28,18 +195,14 @@ class CardDisplay():
     return self.display.plot_single_card('', design.image, text, fontsize)
 
 
-  def plot_cards(self, cards, num_col, show_index=False):
-    card_images = []
-    index = 0
-    for card in cards:
-      design = self._get_design_by_any(card)
-      if show_index:
-        card_images.append( (str(index), design.image) )
-      else:
-        card_images.append( ('', design.image) )
-      index += 1
+  def render_cards(self, cards, num_col, show_index=False):
+    # RGB array of the cards' grid, without matplotlib
+    names = [ self.library.card_image_name(self._get_design_by_any(card).index) for card in cards ]
+    labels = [ str(index) for index in range(len(names)) ] if show_index else None
+    return self.compositor.compose(names, num_col, labels)
 
-    return self.display.plot_cards(card_images, num_col)
+  def plot_cards(self, cards, num_col, show_index=False):
+    return self.display.plot_image(self.render_cards(cards, num_col, show_index))
 
 
   def plot_single_action(self, action, text='', fontsize=14):
@@ -47,24 +210,24 @@ class CardDisplay():
     return self.display.plot_single_card('', action_design.image, text, fontsize)
 
 
+  def render_actions(self, show_index=False):
+    names = [ self.library.action_card_image_name(action_design.index) for action_design in self.library.action_designs ]
+    labels = [ str(index) for index in range(len(names)) ] if show_index else None
+    return self.compositor.compose(names, len(names), labels)
+
   def plot_actions(self, show_index=False):
-    card_images = []
-    index = 0
-    for action_design in self.library.action_designs:
-      if show_index:
-        card_images.append( (str(index), action_design.image) )
-      else:
-        card_images.append( ('', action_design.image) )
-      index += 1
+    return self.display.plot_image(self.render_actions(show_index))
 
-    return self.display.plot_cards(card_images, len(self.library.action_designs))
 
+  def save_image(self, image, filename):
+    # save a rendered grid, without matplotlib
+    Image.fromarray(image).save(filename)
 
   def save(self, plot_filename):
-    plt.savefig(plot_filename, dpi=150, bbox_inches='tight')
+    _pyplot().savefig(plot_filename, dpi=150, bbox_inches='tight')
 
   def show(self):
-    plt.show()
+    _pyplot().show()
 
 
 
@@ -95,7 +258,7 @@ class Display:
   def read_card_image(self, card_index):
     card_name = self.card_image_name(card_index)
     card_filename = '{}/{}.png'.format(self.cards_path, card_name)
-    card_image = mpimg.imread(card_filename)
+    card_image = read_image(card_filename)
     return card_image
 
 
@@ -117,7 +280,7 @@ class Display:
 
 
   def plot_single_card(self, card_name, card_image, text='', fontsize=14, figsize=None):
-    fig, ax = plt.subplots(figsize=self.figsize)
+    fig, ax = _pyplot().subplots(figsize=self.figsize)
     if self.background:
       fig.set_facecolor(self.background)
 
@@ -137,58 +300,25 @@ class Display:
     return (fig, ax)
 
 
-  def plot_cards(self, card_images, num_col):
-    num_images = len(card_images)
-    row = int(num_images/num_col)
-    if num_images % num_col != 0:
-      row += 1
-    col = num_col
-
-    fig, ax = plt.subplots(row, col, figsize=self.figsize)
+  def plot_image(self, image):
+    # a composited image in a single axis
+    fig, ax = _pyplot().subplots(figsize=self.figsize)
     if self.background:
       fig.set_facecolor(self.background)
+    ax.axis('off')
+    ax.imshow(image)
+    return (fig, ax)
 
-    if row > 1:
-      for x in range(row):
-        for y in range(col):
-          ix = (x*col)+y
-          if not self.ticks:
-            ax[x][y].set_xticks([])
-            ax[x][y].set_yticks([])
-          
-          if (ix < num_images):
-            (image_name, image) = card_images[ix]
-            if image_name:
-              ax[x][y].title.set_text(image_name)
-            ax[x][y].imshow(image)
-    elif col > 1:
-      for y in range(col):
-        ix = y
-        if not self.ticks:
-          ax[y].set_xticks([])
-          ax[y].set_yticks([])
-        if (ix < num_images):
-          (image_name, image) = card_images[ix]
-          if image_name:
-            ax[y].title.set_text(image_name)
-          ax[y].imshow(image)
-        else:
-          # switch off the axis
-          ax[y].axis('off')
-    else:
-      if not self.ticks:
-        ax.set_xticks([])
-        ax.set_yticks([])
-        (image_name, image) = card_images[0]
-        if image_name:
-          ax.title.set_text(image_name)
-        ax.imshow(image)
 
-    return (fig, ax)
+  def plot_cards(self, card_images, num_col):
+    # (name, image) pairs composited into one image, a single axis instead of one per card
+    images = [ to_rgb8(image) for (image_name, image) in card_images ]
+    names = [ image_name for (image_name, image) in card_images ]
+    return self.plot_image(composite(images, num_col, names if any(names) else None))
 
     
   def save(self, plot_filename):
-    plt.savefig(plot_filename, dpi=150, bbox_inches='tight')
+    _pyplot().savefig(plot_filename, dpi=150, bbox_inches='tight')
 
   def show(self):
-    plt.show()
+    _pyplot().show()
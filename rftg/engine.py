@@ -0,0 +1,590 @@
+import cProfile
+import time
+
+from .enums import *
+from .cards import Library, ImageMode
+from .game import GameResource, Game, Player
+
+# Headless game engine, following the phase structure of Keldon Jones's
+# engine.c: every decision goes through Game.ask_player to the player's
+# Decision, nothing is displayed and nothing is read from stdin.
+#
+# Only the core rules are implemented:
+#   - start world choice, 6 card hand with 2 discards, 10 card hand limit
+#   - explore, develop, settle (military and paid worlds, windfall goods),
+#     consume (trade and consume powers), produce, with the phase bonuses
+#   - P1 DRAW/KEEP, P2 DRAW/REDUCE/DRAW_AFTER, P3 REDUCE/EXTRA_MILITARY
+#     (also those limited to a good type)/DRAW_AFTER, P4 TRADE_*, CONSUME_*
+#     with GET_VP/GET_CARD/GET_2_CARD/GET_3_CARD, DRAW and VP, P5 PRODUCE,
+#     WINDFALL_* and DRAW
+#   - game end on an empty VP pool or a 12 card tableau, scoring with the
+#     6-cost development bonuses
+# Goals, takeovers, prestige, search and the remaining powers are ignored,
+# so expansions play with their cards but without their special rules.
+# Goods are counted on the world (Card.num_goods), not taken from the deck.
+
+HAND_LIMIT = 10
+TABLEAU_END = 12
+VP_PER_PLAYER = 12
+START_HAND = 6
+START_DISCARD = 2
+
+ACTIONS = (
+  Action.EXPLORE_5_0,
+  Action.EXPLORE_1_1,
+  Action.DEVELOP,
+  Action.SETTLE,
+  Action.CONSUME_TRADE,
+  Action.CONSUME_X2,
+  Action.PRODUCE,
+)
+
+TRADE_PRICE = {
+  GoodType.NOVELTY: 2,
+  GoodType.RARE: 3,
+  GoodType.GENE: 4,
+  GoodType.ALIEN: 5,
+}
+
+# good type qualifiers of powers
+P3_GOODS = {
+  PhasePower.P3_NOVELTY: GoodType.NOVELTY,
+  PhasePower.P3_RARE: GoodType.RARE,
+  PhasePower.P3_GENE: GoodType.GENE,
+  PhasePower.P3_ALIEN: GoodType.ALIEN,
+}
+P4_TRADE_GOODS = {
+  PhasePower.P4_TRADE_NOVELTY: GoodType.NOVELTY,
+  PhasePower.P4_TRADE_RARE: GoodType.RARE,
+  PhasePower.P4_TRADE_GENE: GoodType.GENE,
+  PhasePower.P4_TRADE_ALIEN: GoodType.ALIEN,
+}
+P4_CONSUME_GOODS = {
+  PhasePower.P4_CONSUME_NOVELTY: GoodType.NOVELTY,
+  PhasePower.P4_CONSUME_RARE: GoodType.RARE,
+  PhasePower.P4_CONSUME_GENE: GoodType.GENE,
+  PhasePower.P4_CONSUME_ALIEN: GoodType.ALIEN,
+}
+P4_CONSUME_CARDS = {
+  PhasePower.P4_GET_2_CARD: 2,
+  PhasePower.P4_GET_3_CARD: 3,
+}
+P5_WINDFALL_GOODS = {
+  PhasePower.P5_WINDFALL_NOVELTY: GoodType.NOVELTY,
+  PhasePower.P5_WINDFALL_RARE: GoodType.RARE,
+  PhasePower.P5_WINDFALL_GENE: GoodType.GENE,
+  PhasePower.P5_WINDFALL_ALIEN: GoodType.ALIEN,
+}
+ALL_GOODS = frozenset(TRADE_PRICE)
+
+# 6-cost development bonuses, one point per matching card
+VP_FLAGS = {
+  VP.REBEL_FLAG: CardFlag.REBEL,
+  VP.ALIEN_FLAG: CardFlag.ALIEN,
+  VP.TERRAFORMING_FLAG: CardFlag.TERRAFORMING,
+  VP.UPLIFT_FLAG: CardFlag.UPLIFT,
+  VP.IMPERIUM_FLAG: CardFlag.IMPERIUM,
+  VP.CHROMO_FLAG: CardFlag.CHROMO,
+}
+VP_PRODUCTION = {
+  VP.NOVELTY_PRODUCTION: GoodType.NOVELTY,
+  VP.RARE_PRODUCTION: GoodType.RARE,
+  VP.GENE_PRODUCTION: GoodType.GENE,
+  VP.ALIEN_PRODUCTION: GoodType.ALIEN,
+}
+VP_WINDFALL = {
+  VP.NOVELTY_WINDFALL: GoodType.NOVELTY,
+  VP.RARE_WINDFALL: GoodType.RARE,
+  VP.GENE_WINDFALL: GoodType.GENE,
+  VP.ALIEN_WINDFALL: GoodType.ALIEN,
+}
+
+
+class Engine:
+
+  def __init__(self, game):
+    self.game = game
+    self.deck = game.deck
+    self.library = game.resource.library
+    self.designs = self.library.designs
+    self.power_groups = self.library.get_power_groups()
+    self.num_players = len(game.players)
+
+  def __repr__(self):
+    return '<Engine {}>'.format(self.game)
+
+  def play(self, until_round=None):
+    """ Play the game to the end and score it, or stop unscored once
+    until_round rounds are played.
+    """
+    self.begin_game()
+    return self.play_rounds(until_round)
+
+  def resume(self, until_round=None):
+    """ Continue a game stopped between rounds, by play(until_round) or
+    restored from a snapshot or a rftg.codec record, as play() does.
+    """
+    for (player_index, decision) in enumerate(self.game.decisions):
+      decision.init(player_index, 0)
+    return self.play_rounds(until_round)
+
+  def play_rounds(self, until_round=None):
+    while not self.game.game_over:
+      if until_round is not None and self.game.round >= until_round:
+        return self.game
+      self.game_round()
+    self.score_game()
+    return self.game
+
+  # helpers
+  def design(self, card):
+    return self.designs[card.index]
+
+  def groups(self, player_index, phase):
+    # (card, codes, value, times) for every power line of the phase on the tableau
+    power_groups = self.power_groups
+    cards = self.deck.cards
+    for where in self.deck.get_player_powers(player_index, phase):
+      card = cards[where.card]
+      group = power_groups[card.index][where.power]
+      if group is not None:
+        yield (card, group[1], group[2], group[3])
+
+  def draw(self, player_index, number):
+    deck = self.deck
+    if number <= 0:
+      return []
+    if not deck.has_cards(number):
+      # reshuffle the discard pile into the deck
+      deck.rebuild_deck()
+      deck.shuffle_cards()
+    return deck.draw_cards(min(number, deck.remain_cards()), Location.HAND, player_index)
+
+  def hand(self, player_index):
+    return self.deck.get_cards_by_player_location(player_index, Location.HAND)
+
+  def tableau(self, player_index):
+    return self.deck.get_cards_by_player_location(player_index, Location.ACTIVE)
+
+  def goods(self, player_index, good_types=ALL_GOODS):
+    designs = self.designs
+    return [ card for card in self.tableau(player_index)
+      if card.num_goods > 0 and designs[card.index].good in good_types ]
+
+  def windfall_worlds(self, player_index, good_types=ALL_GOODS, exclude=None):
+    designs = self.designs
+    result = []
+    for card in self.tableau(player_index):
+      design = designs[card.index]
+      if card.num_goods == 0 and card is not exclude and design.good in good_types and CardFlag.WINDFALL in design.flags:
+        result.append(card)
+    return result
+
+  def gain_vp(self, player, vp):
+    player.vp += vp
+    self.game.vp_pool -= vp
+
+  def ask(self, player_index, type, **kwargs):
+    return self.game.ask_player(player_index, type, **kwargs)
+
+  def prepare_phase(self, phase):
+    for (player_index, decision) in enumerate(self.game.decisions):
+      decision.prepare_phase(player_index, phase)
+
+  # game flow
+  def begin_game(self):
+    game = self.game
+    deck = self.deck
+    game.vp_pool = VP_PER_PLAYER * self.num_players
+    for (player_index, decision) in enumerate(game.decisions):
+      decision.init(player_index, 0)
+
+    deck.shuffle_cards()
+    start_worlds = deck.get_random_start_world_cards()
+    if len(start_worlds) < self.num_players:
+      raise ValueError('{} start worlds for {} players, use a larger expansion'.format(
+        len(start_worlds), self.num_players))
+    deck.pick_cards(start_worlds, Location.ASIDE)
+    for player_index in range(self.num_players):
+      # two start worlds to choose from, when there are enough
+      count = 2 if len(start_worlds) >= 2 * self.num_players else 1
+      candidates = start_worlds[player_index * count:(player_index + 1) * count]
+      chosen = self.ask(player_index, Choice.START, cards=candidates)
+      game.set_player_cards(player_index, chosen, Location.ACTIVE)
+      game.players[player_index].start = chosen[0].slot
+    # start worlds not chosen go to the discard pile
+    deck.discard_cards([ card for card in start_worlds if card.location == Location.ASIDE ])
+
+    for player_index in range(self.num_players):
+      cards = self.draw(player_index, START_HAND)
+      chosen = self.ask(player_index, Choice.DISCARD, cards=cards, discard=START_DISCARD)
+      deck.discard_cards(chosen)
+
+  def game_round(self):
+    game = self.game
+    game.round += 1
+    game.cur_action = Phase.ACTION
+    game.action_selected = []
+    for (player_index, player) in enumerate(game.players):
+      player.prev_actions = player.actions
+      player.actions = self.ask(player_index, Choice.ACTION, actions=ACTIONS, count=1)
+      player.phase_bonus_used = False
+      game.action_selected.extend(player.actions)
+
+    selected = set(game.action_selected)
+    if Action.EXPLORE_5_0 in selected or Action.EXPLORE_1_1 in selected:
+      self.phase_explore()
+    if Action.DEVELOP in selected:
+      self.phase_develop()
+    if Action.SETTLE in selected:
+      self.phase_settle()
+    if Action.CONSUME_TRADE in selected or Action.CONSUME_X2 in selected:
+      self.phase_consume()
+    if Action.PRODUCE in selected:
+      self.phase_produce()
+    self.phase_discard()
+
+    # game ends after the round when the pool is empty or a tableau is full
+    if game.vp_pool <= 0 or any(len(self.tableau(i)) >= TABLEAU_END for i in range(self.num_players)):
+      game.game_over = True
+
+  def phase_explore(self):
+    self.game.cur_action = Phase.EXPLORE
+    self.prepare_phase(Phase.EXPLORE)
+    for (player_index, player) in enumerate(self.game.players):
+      draw = 2
+      keep = 1
+      if Action.EXPLORE_5_0 in player.actions:
+        draw += 5
+      if Action.EXPLORE_1_1 in player.actions:
+        draw += 1
+        keep += 1
+      for (card, codes, value, times) in self.groups(player_index, 1):
+        if PhasePower.P1_DRAW in codes:
+          draw += value
+        if PhasePower.P1_KEEP in codes:
+          keep += value
+
+      cards = self.draw(player_index, draw)
+      discard = len(cards) - keep
+      if discard > 0:
+        chosen = self.ask(player_index, Choice.DISCARD, cards=cards, discard=discard)
+        self.deck.discard_cards(chosen)
+
+  def phase_develop(self):
+    self.game.cur_action = Phase.DEVELOP
+    self.prepare_phase(Phase.DEVELOP)
+    for (player_index, player) in enumerate(self.game.players):
+      reduce = 1 if Action.DEVELOP in player.actions else 0
+      draw_after = 0
+      for (card, codes, value, times) in self.groups(player_index, 2):
+        if PhasePower.P2_DRAW in codes:
+          self.draw(player_index, value)
+        elif PhasePower.P2_REDUCE in codes:
+          reduce += value
+        elif PhasePower.P2_DRAW_AFTER in codes:
+          draw_after += value
+
+      hand = self.hand(player_index)
+      candidates = [ card for card in hand if self.design(card).type == CardType.DEVELOPMENT
+        and max(0, self.design(card).cost - reduce) <= len(hand) - 1 ]
+      if not candidates:
+        continue
+      chosen = self.ask(player_index, Choice.PLACE, cards=candidates, phase=Phase.DEVELOP)
+      if not chosen:
+        continue
+      self.place(player_index, chosen[0], max(0, self.design(chosen[0]).cost - reduce))
+      self.draw(player_index, draw_after)
+
+  def settle_cost(self, player_index, player, design):
+    # (cost in cards or None, military needed or None) to settle the world
+    reduce = 0
+    military = 0
+    for (card, codes, value, times) in self.groups(player_index, 3):
+      goods = [ P3_GOODS[code] for code in codes if code in P3_GOODS ]
+      if goods and design.good not in goods:
+        continue
+      if PhasePower.P3_REDUCE in codes and len(codes) - len(goods) == 1:
+        reduce += value
+      elif PhasePower.P3_EXTRA_MILITARY in codes and len(codes) - len(goods) == 1:
+        military += value
+    if CardFlag.MILITARY in design.flags:
+      return (None, military)
+    return (max(0, design.cost - reduce), None)
+
+  def phase_settle(self):
+    self.game.cur_action = Phase.SETTLE
+    self.prepare_phase(Phase.SETTLE)
+    for (player_index, player) in enumerate(self.game.players):
+      draw_after = 0
+      for (card, codes, value, times) in self.groups(player_index, 3):
+        if PhasePower.P3_DRAW_AFTER in codes:
+          draw_after += value
+
+      hand = self.hand(player_index)
+      candidates = []
+      costs = {}
+      for card in hand:
+        design = self.design(card)
+        if design.type != CardType.WORLD:
+          continue
+        (cost, military) = self.settle_cost(player_index, player, design)
+        if cost is not None and cost <= len(hand) - 1:
+          candidates.append(card)
+          costs[card.slot] = cost
+        elif military is not None and military >= design.cost:
+          candidates.append(card)
+          costs[card.slot] = 0
+      if not candidates:
+        continue
+      chosen = self.ask(player_index, Choice.PLACE, cards=candidates, phase=Phase.SETTLE)
+      if not chosen:
+        continue
+      world = chosen[0]
+      self.place(player_index, world, costs[world.slot])
+      if CardFlag.WINDFALL in self.design(world).flags:
+        world.num_goods = 1
+      if Action.SETTLE in player.actions:
+        draw_after += 1
+      self.draw(player_index, draw_after)
+
+  def place(self, player_index, card, cost):
+    self.game.set_player_cards(player_index, [ card ], Location.ACTIVE)
+    if cost > 0:
+      hand = self.hand(player_index)
+      payment = self.ask(player_index, Choice.PAYMENT, cards=hand, cost=cost)
+      self.deck.discard_cards(payment)
+
+  def phase_consume(self):
+    self.game.cur_action = Phase.CONSUME
+    self.prepare_phase(Phase.CONSUME)
+    for (player_index, player) in enumerate(self.game.players):
+      groups = list(self.groups(player_index, 4))
+      if Action.CONSUME_TRADE in player.actions:
+        self.trade(player_index, groups)
+
+      double = 2 if Action.CONSUME_X2 in player.actions else 1
+      for (card, codes, value, times) in groups:
+        if PhasePower.P4_DRAW in codes:
+          self.draw(player_index, value)
+        elif PhasePower.P4_VP in codes:
+          self.gain_vp(player, value)
+        else:
+          self.consume(player_index, player, codes, value, times, double)
+
+  def trade(self, player_index, groups):
+    goods = self.goods(player_index)
+    if not goods:
+      return
+    chosen = self.ask(player_index, Choice.TRADE, cards=goods)
+    if not chosen:
+      return
+    world = chosen[0]
+    good = self.design(world).good
+    price = TRADE_PRICE[good]
+    for (card, codes, value, times) in groups:
+      if PhasePower.P4_TRADE_ANY in codes:
+        price += value
+      elif PhasePower.P4_TRADE_THIS in codes and card is world:
+        price += value
+      else:
+        for code in codes:
+          if P4_TRADE_GOODS.get(code) == good:
+            price += value
+    world.num_goods = 0
+    self.draw(player_index, price)
+
+  def consume(self, player_index, player, codes, value, times, double):
+    if PhasePower.P4_CONSUME_ANY in codes:
+      good_types = ALL_GOODS
+    else:
+      good_types = frozenset(P4_CONSUME_GOODS[code] for code in codes if code in P4_CONSUME_GOODS)
+      if not good_types:
+        # discard, prestige and other consume powers are not implemented
+        return
+    need = 2 if PhasePower.P4_CONSUME_TWO in codes else 1
+    if PhasePower.P4_CONSUME_3_DIFF in codes or PhasePower.P4_CONSUME_N_DIFF in codes:
+      return
+
+    cards = 0
+    if PhasePower.P4_GET_CARD in codes:
+      cards += value
+    for (code, number) in P4_CONSUME_CARDS.items():
+      if code in codes:
+        cards += number
+    vp = value if PhasePower.P4_GET_VP in codes else 0
+
+    for time in range(max(1, times)):
+      goods = self.goods(player_index, good_types)
+      if len(goods) < need:
+        break
+      chosen = self.ask(player_index, Choice.GOOD, cards=goods, min=need, max=need)
+      for world in chosen:
+        world.num_goods = 0
+      self.gain_vp(player, vp * double)
+      self.draw(player_index, cards)
+
+  def phase_produce(self):
+    self.game.cur_action = Phase.PRODUCE
+    self.prepare_phase(Phase.PRODUCE)
+    for (player_index, player) in enumerate(self.game.players):
+      for (card, codes, value, times) in self.groups(player_index, 5):
+        if PhasePower.P5_PRODUCE in codes:
+          if len(codes) == 1 and card.num_goods == 0:
+            card.num_goods = 1
+        elif PhasePower.P5_DRAW in codes and len(codes) == 1:
+          self.draw(player_index, value)
+        elif PhasePower.P5_WINDFALL_ANY in codes:
+          self.produce_windfall(player_index, ALL_GOODS, card, codes)
+        else:
+          good_types = frozenset(P5_WINDFALL_GOODS[code] for code in codes if code in P5_WINDFALL_GOODS)
+          if good_types:
+            self.produce_windfall(player_index, good_types, card, codes)
+
+      if Action.PRODUCE in player.actions:
+        self.produce_windfall(player_index, ALL_GOODS, None, ())
+
+  def produce_windfall(self, player_index, good_types, card, codes):
+    if PhasePower.P5_DISCARD in codes:
+      return
+    exclude = card if PhasePower.P5_NOT_THIS in codes else None
+    worlds = self.windfall_worlds(player_index, good_types, exclude)
+    if not worlds:
+      return
+    chosen = self.ask(player_index, Choice.WINDFALL, cards=worlds)
+    for world in chosen:
+      world.num_goods = 1
+
+  def phase_discard(self):
+    self.game.cur_action = Phase.DISCARD
+    for (player_index, player) in enumerate(self.game.players):
+      hand = self.hand(player_index)
+      player.end_discard = max(0, len(hand) - HAND_LIMIT)
+      if player.end_discard:
+        chosen = self.ask(player_index, Choice.DISCARD, cards=hand, discard=player.end_discard)
+        self.deck.discard_cards(chosen)
+
+  # scoring
+  def bonus_vp(self, design, bonus, tableau):
+    designs = self.designs
+    total = 0
+    for card in tableau:
+      other = designs[card.index]
+      if bonus.type == VP.DEVEL:
+        total += other.type == CardType.DEVELOPMENT
+      elif bonus.type == VP.WORLD:
+        total += other.type == CardType.WORLD
+      elif bonus.type == VP.MILITARY:
+        total += other.type == CardType.WORLD and CardFlag.MILITARY in other.flags
+      elif bonus.type == VP.SIX_DEVEL:
+        total += other.type == CardType.DEVELOPMENT and other.cost == 6
+      elif bonus.type == VP.NONMILITARY_WORLD:
+        total += other.type == CardType.WORLD and CardFlag.MILITARY not in other.flags
+      elif bonus.type in VP_FLAGS:
+        total += VP_FLAGS[bonus.type] in other.flags
+      elif bonus.type in VP_PRODUCTION:
+        total += other.good == VP_PRODUCTION[bonus.type] and CardFlag.WINDFALL not in other.flags
+      elif bonus.type in VP_WINDFALL:
+        total += other.good == VP_WINDFALL[bonus.type] and CardFlag.WINDFALL in other.flags
+      elif bonus.type == VP.NAME:
+        total += other.name == bonus.name and other is not design
+    return total * bonus.point
+
+  def score_player(self, player_index):
+    player = self.game.players[player_index]
+    tableau = self.tableau(player_index)
+    score = player.vp
+    for card in tableau:
+      design = self.design(card)
+      score += design.vp
+      for bonus in design.bonuses:
+        if bonus.type == VP.THREE_VP:
+          score += player.vp // 3 * bonus.point
+        else:
+          score += self.bonus_vp(design, bonus, tableau)
+    return score
+
+  def score_game(self):
+    game = self.game
+    best = None
+    for (player_index, player) in enumerate(game.players):
+      player.end_vp = self.score_player(player_index)
+      # ties are broken by cards in hand plus goods
+      tie_break = len(self.hand(player_index)) + len(self.goods(player_index))
+      key = (player.end_vp, tie_break)
+      if best is None or key > best:
+        best = key
+    for (player_index, player) in enumerate(game.players):
+      tie_break = len(self.hand(player_index)) + len(self.goods(player_index))
+      player.winner = (player.end_vp, tie_break) == best
+    for (player_index, decision) in enumerate(game.decisions):
+      decision.game_over(player_index)
+
+
+def play_game(resource, num_players=2, expansion=0, seed=0, decision_class=None, profiler=None):
+  """ Play one headless game from seed, decision_class(game, seed) making
+  each player's Decision (RandomDecision by default). A rftg.profiling.Profiler
+  given times the game's decisions, phases, deck and networks, and is
+  uninstrumented once the game is over.
+  """
+  from .decision import RandomDecision
+
+  if decision_class is None:
+    decision_class = RandomDecision
+  players = [ Player(name='Player {}'.format(i), ai=True) for i in range(num_players) ]
+  game = Game(resource=resource, players=players, expanded=expansion, start_seed=seed)
+  game.decisions = [ decision_class(game, seed * num_players + i) for i in range(num_players) ]
+  engine = Engine(game)
+  if profiler is None:
+    return engine.play()
+  profiler.instrument(game, engine)
+  try:
+    return engine.play()
+  finally:
+    # drop the wrappers, and with them the profiler's references to the game
+    profiler.uninstrument()
+
+
+def simulate(num_games=100, num_players=2, expansion=0, seed=0, decision_class=None, library=None, profile=None,
+    profiler=None):
+  """ Play num_games headless games with seeds seed, seed+1, ... and report
+  the games per second, decision_class and profiler as play_game(). With
+  profile set to a filename, the games run under cProfile and the stats
+  are written there.
+  """
+  if library is None:
+    library = Library()
+    library.setup(images=ImageMode.NONE)
+  resource = GameResource(library=library)
+
+  cprofile = cProfile.Profile() if profile else None
+  results = []
+  start = time.perf_counter()
+  if cprofile:
+    cprofile.enable()
+  for game_seed in range(seed, seed + num_games):
+    results.append(play_game(resource, num_players, expansion, game_seed, decision_class, profiler))
+  if cprofile:
+    cprofile.disable()
+    cprofile.dump_stats(profile)
+  elapsed = time.perf_counter() - start
+
+  return {
+    'games': num_games,
+    'players': num_players,
+    'expansion': expansion,
+    'seconds': elapsed,
+    'games_per_second': num_games / elapsed,
+    'rounds': sum(game.round for game in results) / num_games,
+    'scores': [ [ player.end_vp for player in game.players ] for game in results ],
+  }
+
+
+if __name__ == '__main__':
+  import sys
+
+  args = [ int(arg) for arg in sys.argv[1:] ]
+  (num_games, num_players, expansion) = (args + [ 100, 2, 0 ][len(args):])[:3]
+  report = simulate(num_games, num_players, expansion)
+  print('{games} games, {players} players, expansion {expansion}: {games_per_second:.1f} games/s, '
+    '{rounds:.1f} rounds per game'.format(**report))
@@ -1,9 +1,27 @@
+import operator
 import random
+import struct
+from enum import Enum
+
+import numpy as np
+
 from .enums import *
-from .cards import Deck
+from .cards import Card, Deck, LOCATIONS, slot_vars
+
+class ReplayDivergence(ValueError):
+  """ A replayed choice log does not fit the game: the logged choice is not
+  the one asked, it is malformed, or the log ran out with no Decision to
+  carry on.
+  """
+
 
 class Player:
 
+  __slots__ = ('name', 'ai', 'actions', 'prev_actions', 'phase_bonus_used', 'start', 'card_seq',
+    'placing', 'bonus_military', 'bonus_reduce', 'end_discard', 'vp', 'end_vp', 'winner',
+    'drawn_round', 'skip_develop', 'skip_settle', 'low_hand', 'table_order', 'phase_cards',
+    'phase_vp', 'choice_log', 'choice_history')
+
   def __init__(self, **kwargs):
     self.name = kwargs.get('name', '')  # Player's name/color
     self.ai = kwargs.get('ai', False)   # Whether the player is played by the AI
@@ -33,7 +51,43 @@ class Player:
     return '<Player {}/{}>'.format(self.name, self.ai)
 
   def __str__(self):
-    return self.__class__.__name__ + ':' + str(vars(self))
+    return self.__class__.__name__ + ':' + str(slot_vars(self))
+
+  # scalar state for snapshots, placing is packed as its Location value
+  STATE_FIELDS = ('phase_bonus_used', 'start', 'card_seq', 'bonus_military', 'bonus_reduce',
+    'end_discard', 'vp', 'end_vp', 'winner', 'drawn_round', 'skip_develop', 'skip_settle',
+    'low_hand', 'table_order', 'phase_cards', 'phase_vp')
+  _state = struct.Struct('<?7i?i??4ib')
+  _get_state = operator.attrgetter(*STATE_FIELDS)
+
+  def pack(self):
+    return self._state.pack(*self._get_state(self), self.placing.value)
+
+  def unpack(self, buffer):
+    values = self._state.unpack(buffer)
+    for (name, value) in zip(self.STATE_FIELDS, values):
+      setattr(self, name, value)
+    self.placing = LOCATIONS[values[-1]]
+
+
+class GameSnapshot:
+  """ Mutable state of a game, see Game.snapshot. """
+  __slots__ = ('game', 'action_selected', 'players', 'deck', 'random_state')
+
+  def __init__(self, game, action_selected, players, deck, random_state):
+    self.game = game                        # packed game scalars
+    self.action_selected = action_selected
+    self.players = players                  # (packed scalars, actions, prev_actions, log lengths)
+    self.deck = deck
+    self.random_state = random_state          # (random state, NumPy generator state)
+
+  def __repr__(self):
+    return '<GameSnapshot {}>'.format(self.nbytes)
+
+  @property
+  def nbytes(self):
+    return len(self.game) + sum(len(player[0]) for player in self.players) + sum(
+      len(data) for data in self.deck if isinstance(data, bytes))
 
 
 class GameResource:
@@ -41,6 +95,7 @@ class GameResource:
   def __init__(self, **kwargs):
     self.library = kwargs.get('library', None)
     self.display = kwargs.get('display', None)
+    self.networks = kwargs.get('networks', None) # NetworkRegistry shared by all games
 
   def __str__(self):
     return self.__class__.__name__ + ':' + str(vars(self))
@@ -56,7 +111,10 @@ class Game:
     self.random_seed = 0                              # Current random seed
     self.start_seed = kwargs.get('start_seed', random.randint(0, 2**16)) # Specify start seed to replay
     self.players = kwargs.get('players', [])
-    self.expanded = 0         # Number of expansions in use
+    self.decisions = kwargs.get('decisions', []) # Decision of each player
+    self.replay_pos = None                       # Position in each player's choice log when replaying
+    self.expanded = kwargs.get('expanded', 0)    # Number of expansions in use
+    self.advanced = kwargs.get('advanced', False) # Two-player advanced game
     self.promo = False        # Include promo start worlds in deck
     self.vp_pool = 0          # Victory points remaining in the pool
     self.action_selected = [] # Actions selected this round 
@@ -65,11 +123,13 @@ class Game:
     self.round = 0
     self.game_over = False
 
-    # random seed
-    random.seed(self.start_seed)
+    # random generators of this game only, so that concurrent games
+    # in one process are each reproducible from their start seed
+    self.random = random.Random(self.start_seed)
+    self.np_random = np.random.default_rng(self.start_seed)
 
     # build game specific deck
-    self.deck = Deck(self.resource.library)
+    self.deck = Deck(self.resource.library, self.random, self.np_random)
     self.deck.build_deck(self.expanded)
   
   def __repr__(self):
@@ -81,26 +141,58 @@ class Game:
   def shuffle_deck(self):
     self.deck.shuffle_cards()
 
+  # snapshot and restore for search rollouts
+  _state = struct.Struct('<iiiii?')
+
+  def snapshot(self):
+    """ Capture the mutable state of the game, without the shared library,
+    display or networks. Choice logs only grow, so only their lengths are kept.
+    """
+    game = self._state.pack(self.random_seed, self.vp_pool, self.cur_action.value,
+      self.turn, self.round, self.game_over)
+    players = [ (player.pack(), tuple(player.actions), tuple(player.prev_actions),
+      len(player.choice_log), len(player.choice_history)) for player in self.players ]
+    return GameSnapshot(game, tuple(self.action_selected), players, self.deck.snapshot(),
+      (self.random.getstate(), self.np_random.bit_generator.state))
+
+  def restore(self, snapshot):
+    (self.random_seed, self.vp_pool, cur_action, self.turn, self.round,
+      self.game_over) = self._state.unpack(snapshot.game)
+    self.cur_action = Phase(cur_action)
+    self.action_selected = list(snapshot.action_selected)
+    for (player, (state, actions, prev_actions, log_length, history_length)) in zip(self.players, snapshot.players):
+      player.unpack(state)
+      player.actions = list(actions)
+      player.prev_actions = list(prev_actions)
+      del player.choice_log[log_length:]
+      del player.choice_history[history_length:]
+    self.deck.restore(snapshot.deck)
+    (random_state, np_random_state) = snapshot.random_state
+    self.random.setstate(random_state)
+    self.np_random.bit_generator.state = np_random_state
+
+  def get_network(self, kind):
+    # role or eval network for this game's configuration
+    return self.resource.networks.get(kind, self.expanded, len(self.players), self.advanced)
+
   def get_player(self, player_index):
     return self.players[player_index]
 
   def get_player_cards(self, player_index, location=Location.HAND):
-    cards = self.deck.get_cards_by_player_location(player_index, location)
+    # sorted views are kept by the deck's (owner, location) index
     if location == Location.ACTIVE:
-      sorted_cards = self.deck.get_cards_by_order_sorted(cards)
+      sorted_cards = self.deck.get_cards_by_player_location_order_sorted(player_index, location)
     else:
-      world_cards = self.deck.get_cards_by_type_sorted(cards, type=CardType.WORLD)
-      develop_cards = self.deck.get_cards_by_type_sorted(cards, type=CardType.DEVELOPMENT)
-      sorted_cards = world_cards + develop_cards
+      # worlds then developments, each sorted by cost
+      sorted_cards = self.deck.get_cards_by_player_location_cost_sorted(player_index, location)
     return sorted_cards
 
   def set_player_cards(self, player_index, cards, location=Location.HAND):
     player = self.players[player_index]
-    for card in cards:
-      card.owner = player_index
-      card.location = location
-      # if active card, need to know the order they are added
-      if location == Location.ACTIVE:
+    self.deck.move_cards(cards, location, player_index)
+    # if active card, need to know the order they are added
+    if location == Location.ACTIVE:
+      for card in cards:
         card.order = player.card_seq
         player.card_seq += 1
 
@@ -144,4 +236,62 @@ class Game:
 
     In this function we always wait for an answer from the player before returning.
     """
-    pass
\ No newline at end of file
+    if self.replay_pos is not None:
+      if self.replay_pos[player_index] < len(self.players[player_index].choice_log):
+        return self.replay_choice(player_index, type, **kwargs)
+      if player_index >= len(self.decisions):
+        raise ReplayDivergence('replay of player {} ran out of choices at {}, asked {}'.format(
+          player_index, self.replay_pos[player_index], type))
+    decision = self.decisions[player_index]
+    choice = decision.make_choice(player_index, type, **kwargs)
+    decision.wait_answer(player_index)
+    self.log_choice(player_index, type, choice)
+    return choice
+
+  def start_replay(self, choice_logs):
+    """ Replay the given choice log of each player: ask_player answers from
+    the logs, without asking the decisions, until a player's log runs out;
+    the player's decision carries on from there, ReplayDivergence is raised
+    when there is none.
+    """
+    for (player, log) in zip(self.players, choice_logs):
+      player.choice_log = list(log)
+    self.replay_pos = [ 0 ] * len(self.players)
+
+  def replay_choice(self, player_index, type, **kwargs):
+    log = self.players[player_index].choice_log
+    pos = self.replay_pos[player_index]
+    if log[pos] != type.value:
+      raise ReplayDivergence('replay of player {} diverged at {}: logged {}, asked {}'.format(
+        player_index, pos, log[pos], type))
+    if pos + 1 >= len(log) or pos + 2 + log[pos + 1] > len(log):
+      raise ReplayDivergence('replay of player {} has a truncated {} choice at {}'.format(player_index, type, pos))
+    items = log[pos + 2:pos + 2 + log[pos + 1]]
+    self.replay_pos[player_index] = pos + 2 + len(items)
+    # items are logged as card slots, action values or numbers, see log_choice
+    # and must be among those offered
+    if 'cards' in kwargs:
+      offered = { card.slot: card for card in kwargs['cards'] }
+      if not all(slot in offered for slot in items):
+        raise ReplayDivergence('replay of player {} chose cards not offered at {}: {}'.format(player_index, pos, items))
+      return [ offered[slot] for slot in items ]
+    if 'actions' in kwargs:
+      offered = { action.value: action for action in kwargs['actions'] }
+      if not all(value in offered for value in items):
+        raise ReplayDivergence('replay of player {} chose actions not offered at {}: {}'.format(player_index, pos, items))
+      return [ offered[value] for value in items ]
+    return items
+
+  def log_choice(self, player_index, type, choice):
+    # choice log is flat ints: choice type, number of items, then the items
+    # (card slots, action values or numbers)
+    log = self.players[player_index].choice_log
+    log.append(type.value)
+    log.append(len(choice))
+    for item in choice:
+      if isinstance(item, Card):
+        log.append(item.slot)
+      elif isinstance(item, Enum):
+        log.append(item.value)
+      else:
+        log.append(item)
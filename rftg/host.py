@@ -0,0 +1,215 @@
+import asyncio
+import concurrent.futures
+
+from .enums import *
+from .decision import Decision, AsyncDecision, ExecutorDecision, RandomDecision
+from .engine import Engine
+
+# Host for many simultaneous tables in one process. Each table's engine
+# runs on a thread of its own and blocks only on its own players, whose
+# AsyncDecision coroutines run on the host's event loop:
+#
+#   - AI players: ExecutorDecision around a blocking Decision, choices run
+#     in the host's AI executor
+#   - human players: RemoteDecision, which posts a Question on the host's
+#     questions queue and waits for a client to answer it
+#   - local_client() answers questions in place of remote humans
+#
+# A table waiting on a slow human holds only its own thread, the other
+# tables and the event loop carry on.
+
+
+class Question:
+  """ A choice a remote player has to make, answered with answer(choice). """
+
+  __slots__ = ('session_id', 'player_index', 'type', 'kwargs', 'future')
+
+  def __init__(self, session_id, player_index, type, kwargs, future):
+    self.session_id = session_id
+    self.player_index = player_index
+    self.type = type
+    self.kwargs = kwargs
+    self.future = future
+
+  def __repr__(self):
+    return '<Question {}/{}/{}>'.format(self.session_id, self.player_index, self.type)
+
+  @property
+  def answered(self):
+    return self.future.done()
+
+  def answer(self, choice):
+    # call on the host's event loop
+    if not self.future.done():
+      self.future.set_result(choice)
+
+
+class RemoteDecision(AsyncDecision):
+  """ Human player: choices are posted as Questions on the host and
+  awaited until a client answers.
+  """
+
+  def __init__(self, game, host):
+    super().__init__(game)
+    self.host = host
+
+  async def init(self, who, factor):
+    pass
+
+  async def notify_rotation(self, who):
+    pass
+
+  async def prepare_phase(self, who, phase, *args):
+    pass
+
+  async def make_choice(self, who, type, **kwargs):
+    question = Question(self.game.session_id, who, type, kwargs, asyncio.get_running_loop().create_future())
+    await self.host.ask(question)
+    return await question.future
+
+  async def wait_answer(self, who):
+    pass
+
+  async def explore_sample(self, who, draw, keep, discard):
+    pass
+
+  async def game_over(self, who):
+    pass
+
+  async def shutdown(self, who):
+    pass
+
+  async def private_message(self, who, msg, tag):
+    pass
+
+
+class BlockingDecision(Decision):
+  # Decision for the engine's thread, running the AsyncDecision on the host's loop
+
+  def __init__(self, decision, loop):
+    super().__init__(decision.game)
+    self.decision = decision
+    self.loop = loop
+
+  def _call(self, coroutine):
+    return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+  def init(self, who, factor):
+    self._call(self.decision.init(who, factor))
+
+  def notify_rotation(self, who):
+    self._call(self.decision.notify_rotation(who))
+
+  def prepare_phase(self, who, phase, *args):
+    self._call(self.decision.prepare_phase(who, phase, *args))
+
+  def make_choice(self, who, type, **kwargs):
+    return self._call(self.decision.make_choice(who, type, **kwargs))
+
+  def wait_answer(self, who):
+    self._call(self.decision.wait_answer(who))
+
+  def explore_sample(self, who, draw, keep, discard):
+    self._call(self.decision.explore_sample(who, draw, keep, discard))
+
+  def game_over(self, who):
+    self._call(self.decision.game_over(who))
+
+  def shutdown(self, who):
+    self._call(self.decision.shutdown(who))
+
+  def private_message(self, who, msg, tag):
+    self._call(self.decision.private_message(who, msg, tag))
+
+
+class GameHost:
+  """ Multiplex game sessions, keyed by Game.session_id, on one event loop. """
+
+  def __init__(self, max_tables=64, ai_workers=None):
+    self.max_tables = max_tables
+    self.tables = {}     # session_id -> asyncio task of the table's game
+    self.games = {}      # session_id -> Game
+    self.questions = None # asyncio.Queue of Questions, created by start() on the host's loop
+    self.pending = {}    # (session_id, player_index) -> unanswered Question
+    self.table_executor = concurrent.futures.ThreadPoolExecutor(max_tables, thread_name_prefix='table')
+    self.ai_executor = concurrent.futures.ThreadPoolExecutor(ai_workers, thread_name_prefix='ai')
+
+  def __repr__(self):
+    return '<GameHost {}/{}>'.format(len(self.tables), self.max_tables)
+
+  async def start(self):
+    """ Bind the host to the running event loop, before its tables and
+    clients start. Returns the host.
+    """
+    # the queue is created here rather than in __init__: before Python 3.10
+    # it binds to the current loop when created, not to the one that runs it
+    if self.questions is None:
+      self.questions = asyncio.Queue()
+    return self
+
+  async def ask(self, question):
+    self.pending[(question.session_id, question.player_index)] = question
+    question.future.add_done_callback(
+      lambda future: self.pending.pop((question.session_id, question.player_index), None))
+    await self.questions.put(question)
+
+  def answer(self, session_id, player_index, choice):
+    self.pending[(session_id, player_index)].answer(choice)
+
+  def start_table(self, game, decisions):
+    """ Start playing game with an AsyncDecision for each player, returning
+    the task that finishes with the game once it is scored.
+    """
+    if self.questions is None:
+      raise RuntimeError('host is not started, await host.start() first')
+    if game.session_id in self.tables:
+      raise ValueError('session {} is already hosted'.format(game.session_id))
+    if len(self.tables) >= self.max_tables:
+      raise ValueError('host is full ({} tables)'.format(self.max_tables))
+    loop = asyncio.get_running_loop()
+    game.decisions = [ BlockingDecision(decision, loop) for decision in decisions ]
+    task = asyncio.ensure_future(loop.run_in_executor(self.table_executor, Engine(game).play))
+    self.tables[game.session_id] = task
+    self.games[game.session_id] = game
+    task.add_done_callback(lambda task: self._table_done(game.session_id))
+    return task
+
+  def _table_done(self, session_id):
+    self.tables.pop(session_id, None)
+    self.games.pop(session_id, None)
+
+  def ai_decision(self, game, seed=None, decision_class=RandomDecision):
+    # AI player whose choices run in the host's AI executor
+    return ExecutorDecision(decision_class(game, seed), self.ai_executor)
+
+  async def join(self):
+    # wait for every table
+    if self.tables:
+      await asyncio.gather(*list(self.tables.values()))
+
+  def close(self):
+    for question in list(self.pending.values()):
+      question.future.cancel()
+    self.table_executor.shutdown(wait=False)
+    self.ai_executor.shutdown(wait=False)
+
+
+async def local_client(host, decision_class=RandomDecision, delay=0.0, seed=None):
+  """ Stand-in for remote clients: answer every question posted on the host
+  with decision_class's choice, after delay seconds. Questions are answered
+  concurrently, as separate clients would.
+  """
+  await host.start()
+  decisions = {}
+
+  async def reply(question, decision):
+    if delay:
+      await asyncio.sleep(delay)
+    question.answer(decision.make_choice(question.player_index, question.type, **question.kwargs))
+
+  while True:
+    question = await host.questions.get()
+    key = (question.session_id, question.player_index)
+    if key not in decisions:
+      decisions[key] = decision_class(host.games.get(question.session_id), seed)
+    asyncio.ensure_future(reply(question, decisions[key]))
@@ -0,0 +1,215 @@
+import asyncio
+import bisect
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# Network evaluations batched across games. AI seats submit their candidate
+# positions to the broker instead of running the network themselves; each
+# tick the broker takes every pending request, groups them by network key
+# (kind, expansion, players, advanced), runs one forward_batch per group and
+# hands each request its rows of the result.
+#
+# A tick starts once max_batch rows are pending or the oldest request has
+# waited max_wait seconds, whichever comes first. A group of more than
+# max_batch rows is evaluated in several forward passes of at most
+# max_batch rows each.
+
+LATENCY_BOUNDS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+BATCH_BOUNDS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+
+class Histogram:
+  """ Counts of values in buckets; bucket i holds values up to bounds[i],
+  the last bucket those above every bound.
+  """
+
+  def __init__(self, bounds):
+    self.bounds = tuple(bounds)
+    self.counts = [ 0 ] * (len(self.bounds) + 1)
+    self.count = 0
+    self.total = 0.0
+    self.max = None
+
+  def __repr__(self):
+    return '<Histogram {}/{}>'.format(self.count, self.mean)
+
+  def add(self, value, count=1):
+    self.counts[bisect.bisect_left(self.bounds, value)] += count
+    self.count += count
+    self.total += value * count
+    self.max = value if self.max is None else max(self.max, value)
+
+  @property
+  def mean(self):
+    return self.total / self.count if self.count else 0.0
+
+  def percentile(self, q):
+    # upper bound of the bucket holding the q-th percentile
+    if not self.count:
+      return 0.0
+    rank = q / 100 * self.count
+    seen = 0
+    for (bucket, count) in enumerate(self.counts):
+      seen += count
+      if seen >= rank and count:
+        return self.bounds[bucket] if bucket < len(self.bounds) else self.max
+    return self.max
+
+  def to_dict(self):
+    return {
+      'bounds': list(self.bounds),
+      'counts': list(self.counts),
+      'count': self.count,
+      'mean': self.mean,
+      'max': self.max,
+      'p50': self.percentile(50),
+      'p99': self.percentile(99),
+    }
+
+
+class Request:
+
+  __slots__ = ('key', 'X', 'future', 'submitted')
+
+  def __init__(self, key, X, future, submitted):
+    self.key = key              # (kind, expansion, players, advanced)
+    self.X = X                  # (N, num_input) positions
+    self.future = future
+    self.submitted = submitted
+
+
+class InferenceBroker:
+  """ Batch network evaluations from many games, see the module comment.
+  Networks come from the NetworkRegistry given; submit() may be called from
+  any thread, evaluate_async() from any event loop.
+  """
+
+  def __init__(self, registry, max_batch=256, max_wait=0.002):
+    self.registry = registry
+    self.max_batch = max_batch
+    self.max_wait = max_wait
+    self.pending = []
+    self.pending_rows = 0
+    self.latency = Histogram(LATENCY_BOUNDS)  # seconds from submit to the forward pass
+    self.batch_size = Histogram(BATCH_BOUNDS) # rows per forward pass
+    self.requests = 0
+    self.batches = 0
+    self._condition = threading.Condition()
+    self._closed = False
+    self._thread = threading.Thread(target=self._run, name='inference', daemon=True)
+    self._thread.start()
+
+  def __repr__(self):
+    return '<InferenceBroker {}/{}>'.format(self.max_batch, self.max_wait)
+
+  @staticmethod
+  def game_key(game, kind):
+    # network key of a game, as Game.get_network
+    return (kind, game.expanded, len(game.players), game.advanced)
+
+  def submit(self, key, X):
+    """ Queue positions X for the network of key, returning a Future of the
+    (N, num_output) outputs (a single row for a 1-d X).
+    """
+    X = np.asarray(X, dtype=np.float32)
+    future = Future()
+    with self._condition:
+      if self._closed:
+        raise RuntimeError('inference broker is closed')
+      self.pending.append(Request(key, X, future, time.perf_counter()))
+      self.pending_rows += 1 if X.ndim == 1 else len(X)
+      self.requests += 1
+      if len(self.pending) == 1 or self.pending_rows >= self.max_batch:
+        self._condition.notify()
+    return future
+
+  def evaluate(self, key, X):
+    return self.submit(key, X).result()
+
+  async def evaluate_async(self, key, X):
+    return await asyncio.wrap_future(self.submit(key, X))
+
+  def _take(self):
+    # wait for a tick, then take every pending request
+    with self._condition:
+      while not self.pending and not self._closed:
+        self._condition.wait()
+      if not self.pending:
+        return None
+      deadline = self.pending[0].submitted + self.max_wait
+      while self.pending_rows < self.max_batch and not self._closed:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+          break
+        self._condition.wait(remaining)
+      requests = self.pending
+      self.pending = []
+      self.pending_rows = 0
+      return requests
+
+  def _run(self):
+    while True:
+      requests = self._take()
+      if requests is None:
+        return
+      self._dispatch(requests)
+
+  def _dispatch(self, requests):
+    now = time.perf_counter()
+    groups = {}
+    # statistics are updated under the condition's lock, as stats() reads them
+    with self._condition:
+      for request in requests:
+        self.latency.add(now - request.submitted)
+    for request in requests:
+      groups.setdefault(request.key, []).append(request)
+
+    for (key, group) in groups.items():
+      try:
+        network = self.registry.get(*key)
+      except Exception as error:
+        for request in group:
+          request.future.set_exception(error)
+        continue
+      self._forward(network, group)
+
+  def _forward(self, network, requests):
+    # forward passes of at most max_batch rows over the requests' rows
+    try:
+      rows = [ request.X.reshape(1, -1) if request.X.ndim == 1 else request.X for request in requests ]
+      X = np.concatenate(rows)
+      results = [ network.forward_batch(X[start:start + self.max_batch]) for start in range(0, len(X), self.max_batch) ]
+    except Exception as error:
+      for request in requests:
+        request.future.set_exception(error)
+      return
+    with self._condition:
+      for result in results:
+        self.batch_size.add(len(result))
+      self.batches += len(results)
+    result = np.concatenate(results) if len(results) > 1 else results[0]
+    start = 0
+    for (request, X) in zip(requests, rows):
+      output = result[start:start + len(X)]
+      start += len(X)
+      request.future.set_result(output[0] if request.X.ndim == 1 else output)
+
+  def stats(self):
+    with self._condition:
+      return {
+        'requests': self.requests,
+        'batches': self.batches,
+        'pending': len(self.pending),
+        'latency': self.latency.to_dict(),
+        'batch_size': self.batch_size.to_dict(),
+      }
+
+  def close(self):
+    # evaluate what is pending, then stop
+    with self._condition:
+      self._closed = True
+      self._condition.notify()
+    self._thread.join()
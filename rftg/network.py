@@ -0,0 +1,486 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Keldon Jones's networks are stored as text, one weight per line:
+#
+#   num_input num_hidden num_output
+#   num_training
+#   input names (one per line)
+#   hidden weights, node by node (num_input values, then the bias)
+#   output weights, node by node (num_hidden values, then the bias)
+#
+# The binary form holds the same data as a fixed header, the input names
+# and the weights as little-endian float32, laid out input-major so that
+# the weight blocks can be memory-mapped and used directly in a matmul:
+#
+#   header (magic, version, num_input, num_hidden, num_output,
+#           num_training, names_size)
+#   input names (utf-8, newline separated), padded to DATA_ALIGN
+#   hidden weights (num_input+1, num_hidden), last row is the bias
+#   output weights (num_hidden+1, num_output), last row is the bias
+#
+# Loaded networks can be quantized in memory (quantize()): the hidden
+# weights as float16, or as int8 with a float32 scale per input row. The
+# scales fold into the inputs, (X * scale) @ int8 weights, so the kernel
+# stays one matmul. The output layer, num_hidden x num_output, is a small
+# part of the weights but most of the quantization error, so it stays float32.
+
+NETWORK_PATH = 'network'
+BINARY_SUFFIX = '.bin'
+BINARY_MAGIC = b'RFTGNET\0'
+BINARY_VERSION = 1
+BINARY_DTYPE = np.dtype('<f4')
+DATA_ALIGN = 64
+PRECISIONS = ('float64', 'float32', 'float16', 'int8')
+
+_header = struct.Struct('<8sIIIIII')
+
+
+def network_name(network, expansion, players, advanced=False):
+  return 'rftg.%s.%d.%d%s.net' %(network, expansion, players, ('a' if advanced else ''))
+
+
+def sigmoid(x):
+  # same as 1 / (1 + exp(-x)), without overflow for large negative sums
+  return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def softmax(x):
+  x = np.exp(x - x.max(axis=-1, keepdims=True))
+  return x / x.sum(axis=-1, keepdims=True)
+
+
+def _data_offset(names_size):
+  offset = _header.size + names_size
+  return (offset + DATA_ALIGN - 1) // DATA_ALIGN * DATA_ALIGN
+
+
+class Network:
+
+  def __init__(self, network='', expansion=0, players=2, advanced=False):
+    self.network = network
+    self.expansion = expansion
+    self.players = players
+    self.advanced = advanced
+    self.network_name = network_name(network, expansion, players, advanced)
+    self.num_input = 0
+    self.num_hidden = 0
+    self.num_output = 0
+    self.num_training = 0    # number of training iterations
+    self.input_names = []
+    self.hidden = None       # (num_input, num_hidden) weights
+    self.hidden_bias = None  # (num_hidden,) weights
+    self.output = None       # (num_hidden, num_output) weights
+    self.output_bias = None  # (num_output,) weights
+
+  def __repr__(self):
+    return '<Network {} {}/{}/{}>'.format(self.network_name, self.num_input, self.num_hidden, self.num_output)
+
+  def __str__(self):
+    return self.__class__.__name__ + ':' + str(vars(self))
+
+  @property
+  def nbytes(self):
+    return self.hidden.nbytes + self.hidden_bias.nbytes + self.output.nbytes + self.output_bias.nbytes
+
+  def load_net(self, network, expansion, players, advanced=False, path=NETWORK_PATH):
+    """ Load a network, preferring its binary form when it is up to date
+    with the text file. The binary weights are memory-mapped read-only,
+    so every process loading the same file shares its pages.
+    """
+    self.network = network
+    self.expansion = expansion
+    self.players = players
+    self.advanced = advanced
+    self.network_name = network_name(network, expansion, players, advanced)
+
+    filename = os.path.join(path, self.network_name)
+    binary_filename = filename + BINARY_SUFFIX
+    if is_binary_current(filename, binary_filename):
+      self.read_binary(binary_filename)
+    else:
+      self.read_text(filename)
+    return self
+
+  def read_text(self, filename):
+    with open(filename, 'r') as fp:
+      lines = fp.read().splitlines()
+
+    # read network layers size
+    (num_input, num_hidden, num_output) = lines[0].split()
+    self.num_input = int(num_input)
+    self.num_hidden = int(num_hidden)
+    self.num_output = int(num_output)
+    # read number of training iterations
+    self.num_training = int(lines[1])
+    # read input names
+    pos = 2 + self.num_input
+    self.input_names = [ name.strip() for name in lines[2:pos] ]
+
+    # read hidden and output nodes, each node followed by its bias
+    num_hidden_weights = (self.num_input + 1) * self.num_hidden
+    num_output_weights = (self.num_hidden + 1) * self.num_output
+    weights = np.array(lines[pos:pos + num_hidden_weights + num_output_weights], dtype=np.float64)
+    if len(weights) != num_hidden_weights + num_output_weights:
+      raise ValueError('{}: expected {} weights, found {}'.format(
+        filename, num_hidden_weights + num_output_weights, len(weights)))
+
+    hidden = weights[:num_hidden_weights].reshape(self.num_hidden, self.num_input + 1).T
+    output = weights[num_hidden_weights:].reshape(self.num_output, self.num_hidden + 1).T
+    self._set_weights(np.ascontiguousarray(hidden), np.ascontiguousarray(output))
+
+  def read_binary(self, filename):
+    with open(filename, 'rb') as fp:
+      header = fp.read(_header.size)
+      (magic, version, num_input, num_hidden, num_output, num_training, names_size) = _header.unpack(header)
+      if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError('{}: not a version {} binary network'.format(filename, BINARY_VERSION))
+      names = fp.read(names_size).decode('utf-8')
+
+    self.num_input = num_input
+    self.num_hidden = num_hidden
+    self.num_output = num_output
+    self.num_training = num_training
+    self.input_names = names.split('\n') if names else []
+
+    num_hidden_weights = (num_input + 1) * num_hidden
+    num_output_weights = (num_hidden + 1) * num_output
+    # a plain ndarray view of the mapping: the memmap subclass adds its own
+    # overhead to every operation, which shows on single evaluations
+    weights = np.asarray(np.memmap(filename, dtype=BINARY_DTYPE, mode='r',
+      offset=_data_offset(names_size), shape=(num_hidden_weights + num_output_weights,)))
+    hidden = weights[:num_hidden_weights].reshape(num_input + 1, num_hidden)
+    output = weights[num_hidden_weights:].reshape(num_hidden + 1, num_output)
+    self._set_weights(hidden, output)
+
+  def _copy_header(self, network):
+    # everything but the weights
+    self.network = network.network
+    self.expansion = network.expansion
+    self.players = network.players
+    self.advanced = network.advanced
+    self.network_name = network.network_name
+    self.num_input = network.num_input
+    self.num_hidden = network.num_hidden
+    self.num_output = network.num_output
+    self.num_training = network.num_training
+    self.input_names = network.input_names
+
+  def _set_weights(self, hidden, output):
+    # hidden and output include the bias as their last row
+    self.hidden = hidden[:self.num_input]
+    self.hidden_bias = hidden[self.num_input]
+    self.output = output[:self.num_hidden]
+    self.output_bias = output[self.num_hidden]
+
+  # network evaluation, as Keldon Jones's compute_net():
+  # sigmoid hidden nodes and softmax over the output nodes
+  def compute_net(self, x):
+    """ Compute the outputs for a single input vector, one node at a time.
+    This is the reference for forward_batch, not meant for the hot path.
+    """
+    active = [ i for i in range(self.num_input) if x[i] ]
+    hidden_result = np.zeros(self.num_hidden)
+    for j in range(self.num_hidden):
+      total = float(self.hidden_bias[j])
+      for i in active:
+        total += float(self.hidden[i, j]) * float(x[i])
+      hidden_result[j] = 1.0 / (1.0 + np.exp(-total))
+
+    net_result = np.zeros(self.num_output)
+    for k in range(self.num_output):
+      net_result[k] = float(self.output_bias[k]) + float(np.dot(hidden_result, self.output[:, k]))
+    return softmax(net_result)
+
+  def forward_batch(self, X):
+    """ Run an (N, num_input) matrix of inputs through the network,
+    returning the (N, num_output) output probabilities.
+    """
+    X = np.asarray(X, dtype=self.hidden.dtype)
+    hidden_result = sigmoid(X @ self.hidden + self.hidden_bias)
+    return softmax(hidden_result @ self.output + self.output_bias)
+
+  def forward(self, x):
+    return self.forward_batch(np.asarray(x).reshape(1, -1))[0]
+
+  # sparse evaluation: the inputs are 0/1 and few are set, so a position is
+  # the indices of its active inputs and the hidden sums add up their rows
+  def _hidden_rows(self, indices):
+    return self.hidden.take(indices, axis=0)
+
+  def forward_sparse(self, active):
+    """ Outputs for the position whose inputs at the indices active are 1,
+    the others 0. Same as forward() of the dense position.
+    """
+    rows = self._hidden_rows(np.asarray(active, dtype=np.intp))
+    hidden_result = sigmoid(rows.sum(axis=0) + self.hidden_bias)
+    return softmax(hidden_result @ self.output + self.output_bias)
+
+  def forward_sparse_batch(self, positions):
+    """ (N, num_output) outputs for a sequence of N positions, each the
+    indices of its active inputs. Gathering rows costs more per position
+    than a BLAS matmul, so this is slower than forward_batch() on the same
+    positions at every batch size; batches should stay dense.
+    """
+    positions = [ np.asarray(active, dtype=np.intp) for active in positions ]
+    lengths = np.array([ len(active) for active in positions ])
+    rows = self._hidden_rows(np.concatenate(positions) if positions else np.zeros(0, dtype=np.intp))
+    sums = np.zeros((len(positions), self.num_hidden), dtype=rows.dtype)
+    if len(rows):
+      # positions without active inputs have no rows, reduceat only sees the others
+      nonempty = lengths > 0
+      starts = (np.cumsum(lengths) - lengths)[nonempty]
+      sums[nonempty] = np.add.reduceat(rows, starts, axis=0)
+    hidden_result = sigmoid(sums + self.hidden_bias)
+    return softmax(hidden_result @ self.output + self.output_bias)
+
+  def evaluate(self, X):
+    # eval network: win probability of each player, for each position
+    X = np.asarray(X)
+    if X.ndim == 1:
+      return self.forward(X)
+    return self.forward_batch(X)
+
+  def choose_role(self, X):
+    # role network: most likely role (output index) for each position
+    probs = self.evaluate(X)
+    return np.argmax(probs, axis=-1)
+
+  def write_text(self, filename):
+    with open(filename, 'w') as fp:
+      fp.write('{} {} {}\n'.format(self.num_input, self.num_hidden, self.num_output))
+      fp.write('{}\n'.format(self.num_training))
+      for name in self.input_names:
+        fp.write('{}\n'.format(name))
+      hidden = np.vstack([self.hidden, self.hidden_bias]).T
+      output = np.vstack([self.output, self.output_bias]).T
+      for weight in np.concatenate([hidden.ravel(), output.ravel()]):
+        fp.write('%.12e\n' %(weight))
+
+  def write_binary(self, filename):
+    names = '\n'.join(self.input_names).encode('utf-8')
+    header = _header.pack(BINARY_MAGIC, BINARY_VERSION,
+      self.num_input, self.num_hidden, self.num_output, self.num_training, len(names))
+    padding = _data_offset(len(names)) - len(header) - len(names)
+    hidden = np.vstack([self.hidden, self.hidden_bias]).astype(BINARY_DTYPE)
+    output = np.vstack([self.output, self.output_bias]).astype(BINARY_DTYPE)
+
+    # write to a temporary file first, other processes may be mapping the old one
+    temp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(temp_filename, 'wb') as fp:
+      fp.write(header)
+      fp.write(names)
+      fp.write(b'\0' * padding)
+      fp.write(hidden.tobytes())
+      fp.write(output.tobytes())
+    os.replace(temp_filename, filename)
+
+
+class QuantizedNetwork(Network):
+  """ Network with float16 or per-row scaled int8 hidden weights, see the
+  module comment. Evaluation is done in float32; use dequantize() to write
+  the network or run compute_net().
+  """
+
+  def __init__(self, network, precision):
+    super().__init__()
+    self._copy_header(network)
+    self.precision = precision
+    self.hidden_bias = np.asarray(network.hidden_bias, dtype=np.float32)
+    self.output_bias = np.asarray(network.output_bias, dtype=np.float32)
+    self.output = np.asarray(network.output, dtype=np.float32)
+    if precision == 'int8':
+      (self.hidden, self.hidden_scale) = quantize_rows(network.hidden)
+    elif precision == 'float16':
+      self.hidden = np.asarray(network.hidden, dtype=np.float16)
+      self.hidden_scale = None
+    else:
+      raise ValueError('unknown quantized precision {}'.format(precision))
+
+  def __repr__(self):
+    return '<QuantizedNetwork {} {} {}/{}/{}>'.format(
+      self.network_name, self.precision, self.num_input, self.num_hidden, self.num_output)
+
+  @property
+  def nbytes(self):
+    return super().nbytes + (0 if self.hidden_scale is None else self.hidden_scale.nbytes)
+
+  def forward_batch(self, X):
+    X = np.asarray(X, dtype=np.float32)
+    if self.hidden_scale is not None:
+      X = X * self.hidden_scale
+    hidden_result = sigmoid(X @ self.hidden + self.hidden_bias)
+    return softmax(hidden_result @ self.output + self.output_bias)
+
+  def _hidden_rows(self, indices):
+    rows = self.hidden.take(indices, axis=0).astype(np.float32)
+    if self.hidden_scale is not None:
+      rows *= self.hidden_scale.take(indices)[:, None]
+    return rows
+
+  def dequantize(self):
+    network = Network()
+    network._copy_header(self)
+    network.hidden = self.hidden.astype(np.float64)
+    network.output = self.output.astype(np.float64)
+    if self.hidden_scale is not None:
+      network.hidden *= self.hidden_scale[:, None]
+    network.hidden_bias = self.hidden_bias.astype(np.float64)
+    network.output_bias = self.output_bias.astype(np.float64)
+    return network
+
+
+def active_inputs(X):
+  # sparse positions of an (N, num_input) 0/1 matrix, for forward_sparse_batch()
+  return [ np.flatnonzero(x) for x in np.asarray(X) ]
+
+
+def quantize_rows(weights):
+  # int8 weights and the float32 scale of each row, weights ~= int8 * scale
+  weights = np.asarray(weights, dtype=np.float64)
+  scale = np.abs(weights).max(axis=1) / 127.0
+  scale[scale == 0.0] = 1.0
+  return (np.rint(weights / scale[:, None]).astype(np.int8), scale.astype(np.float32))
+
+
+def quantize(network, precision):
+  """ network with its weights stored at precision, one of PRECISIONS.
+  float64 and float32 return plain Networks, float32 sharing the weights of
+  a memory-mapped binary network.
+  """
+  if precision in ('float16', 'int8'):
+    return QuantizedNetwork(network, precision)
+  if precision not in PRECISIONS:
+    raise ValueError('unknown precision {}, expected one of {}'.format(precision, ', '.join(PRECISIONS)))
+  dtype = np.dtype(precision)
+  if network.hidden.dtype == dtype:
+    return network
+  result = Network()
+  result._copy_header(network)
+  result.hidden = np.asarray(network.hidden, dtype=dtype)
+  result.hidden_bias = np.asarray(network.hidden_bias, dtype=dtype)
+  result.output = np.asarray(network.output, dtype=dtype)
+  result.output_bias = np.asarray(network.output_bias, dtype=dtype)
+  return result
+
+
+class NetworkRegistry:
+  """ Networks shared by every game in the process, loaded on first use.
+  Networks are keyed by (kind, expansion, players, advanced), as network_name().
+  When the loaded networks exceed max_bytes, the least recently used are evicted.
+  With a precision (see quantize()), networks are quantized as they are loaded.
+  """
+
+  def __init__(self, path=NETWORK_PATH, max_bytes=32 * 1024 * 1024, precision=None):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.precision = precision
+    self.networks = OrderedDict()
+    self.total_bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._lock = threading.Lock()
+
+  def __repr__(self):
+    return '<NetworkRegistry {}/{}>'.format(len(self.networks), self.total_bytes)
+
+  def __len__(self):
+    return len(self.networks)
+
+  def __contains__(self, key):
+    return key in self.networks
+
+  def get(self, kind, expansion, players, advanced=False):
+    key = (kind, expansion, players, advanced)
+    with self._lock:
+      network = self.networks.get(key)
+      if network is not None:
+        self.hits += 1
+        self.networks.move_to_end(key)
+        return network
+      self.misses += 1
+
+    # load outside the lock, so other tables are not held up
+    network = Network().load_net(kind, expansion, players, advanced, path=self.path)
+    if self.precision is not None:
+      network = quantize(network, self.precision)
+
+    with self._lock:
+      if key in self.networks:
+        # another thread loaded it meanwhile, share that one
+        self.networks.move_to_end(key)
+        return self.networks[key]
+      self.networks[key] = network
+      self.total_bytes += network.nbytes
+      self._evict()
+    return network
+
+  def _evict(self):
+    # never evict the most recent network, even if it alone is over budget
+    while self.total_bytes > self.max_bytes and len(self.networks) > 1:
+      (key, network) = self.networks.popitem(last=False)
+      self.total_bytes -= network.nbytes
+      self.evictions += 1
+
+  def clear(self):
+    with self._lock:
+      self.networks.clear()
+      self.total_bytes = 0
+
+  def stats(self):
+    with self._lock:
+      return {
+        'networks': len(self.networks),
+        'bytes': self.total_bytes,
+        'max_bytes': self.max_bytes,
+        'precision': self.precision,
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+      }
+
+
+def is_binary_current(filename, binary_filename):
+  if not os.path.exists(binary_filename):
+    return False
+  if not os.path.exists(filename):
+    return True
+  return os.path.getmtime(binary_filename) >= os.path.getmtime(filename)
+
+
+def convert_net(filename, binary_filename=None):
+  if binary_filename is None:
+    binary_filename = filename + BINARY_SUFFIX
+  network = Network()
+  network.read_text(filename)
+  network.write_binary(binary_filename)
+  return binary_filename
+
+
+def convert_nets(path=NETWORK_PATH, force=False):
+  """ One-time conversion of every text network in path to binary.
+  Networks whose binary form is already up to date are skipped unless forced.
+  """
+  converted = []
+  for name in sorted(os.listdir(path)):
+    if not name.endswith('.net'):
+      continue
+    filename = os.path.join(path, name)
+    binary_filename = filename + BINARY_SUFFIX
+    if force or not is_binary_current(filename, binary_filename):
+      converted.append(convert_net(filename, binary_filename))
+  return converted
+
+
+if __name__ == '__main__':
+  import sys
+
+  args = [ arg for arg in sys.argv[1:] if not arg.startswith('--') ]
+  path = args[0] if args else NETWORK_PATH
+  for binary_filename in convert_nets(path, force='--force' in sys.argv):
+    print(binary_filename)
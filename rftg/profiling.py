@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+
+from .inference import Histogram, LATENCY_BOUNDS
+
+# Opt-in instrumentation of games. Nothing is timed unless a Profiler
+# instruments the objects: it then replaces their methods, on the instance
+# only, with timed wrappers, and uninstrument() puts them back, including
+# those of the shared network registry and its networks. Instrumented
+# objects are referenced by the profiler until then, so uninstrument each
+# game once it is over (play_game() does); the timings are kept. Labels:
+#
+#   choice:<Choice>     Decision.make_choice, by choice type
+#   prepare:<Phase>     Decision.prepare_phase, by phase
+#   phase:<name>        Engine phases and scoring
+#   deck:<method>       Deck mutations
+#   network:<kind>      Network.forward_batch, for networks of a registry
+#
+# Timers nest (a choice inside a phase), so the report has both the total
+# time of each label and the self time of each stack, the latter exported
+# in the collapsed-stack format of flamegraph.pl and speedscope.
+
+DECK_METHODS = ('draw_cards', 'pick_cards', 'discard_cards', 'move_cards', 'shuffle_cards', 'rebuild_deck')
+ENGINE_METHODS = ('begin_game', 'phase_explore', 'phase_develop', 'phase_settle', 'phase_consume',
+  'phase_produce', 'phase_discard', 'score_game')
+
+
+class Profiler:
+
+  def __init__(self):
+    self.histograms = {}  # label -> Histogram of seconds
+    self.stacks = {}      # label stack -> self seconds
+    self.instrumented = []
+    self._local = threading.local()
+    self._lock = threading.Lock()
+
+  def __repr__(self):
+    return '<Profiler {}>'.format(len(self.histograms))
+
+  def _stack(self):
+    stack = getattr(self._local, 'stack', None)
+    if stack is None:
+      stack = self._local.stack = []
+    return stack
+
+  def wrap(self, label, function):
+    """ function timed under label (a string, or a callable of the call's
+    arguments returning one).
+    """
+    stack_of = self._stack
+    record = self.record
+    dynamic = callable(label)
+
+    def timed(*args, **kwargs):
+      stack = stack_of()
+      # frame: label stack, time spent in nested timers
+      name = label(*args, **kwargs) if dynamic else label
+      frame = [ stack[-1][0] + (name,) if stack else (name,), 0.0 ]
+      stack.append(frame)
+      start = time.perf_counter()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack:
+          stack[-1][1] += elapsed
+        record(frame[0], elapsed, elapsed - frame[1])
+    return timed
+
+  def record(self, path, elapsed, self_time):
+    with self._lock:
+      histogram = self.histograms.get(path[-1])
+      if histogram is None:
+        histogram = self.histograms[path[-1]] = Histogram(LATENCY_BOUNDS)
+      histogram.add(elapsed)
+      self.stacks[path] = self.stacks.get(path, 0.0) + self_time
+
+  def _replace(self, obj, name, label):
+    setattr(obj, name, self.wrap(label, getattr(obj, name)))
+    self.instrumented.append((obj, name))
+
+  # instrumentation
+  def instrument_decision(self, decision):
+    self._replace(decision, 'make_choice', lambda who, type, **kwargs: 'choice:' + type.name)
+    self._replace(decision, 'prepare_phase', lambda who, phase, *args: 'prepare:' + phase.name)
+
+  def instrument_deck(self, deck):
+    for name in DECK_METHODS:
+      self._replace(deck, name, 'deck:' + name)
+
+  def instrument_engine(self, engine):
+    for name in ENGINE_METHODS:
+      self._replace(engine, name, 'phase:' + name.replace('phase_', ''))
+
+  def instrument_network(self, network):
+    if 'forward_batch' not in vars(network):
+      self._replace(network, 'forward_batch', 'network:' + network.network)
+
+  def instrument_registry(self, registry):
+    # networks are instrumented as they are handed out
+    get = registry.get
+
+    def instrumented_get(*args, **kwargs):
+      network = get(*args, **kwargs)
+      self.instrument_network(network)
+      return network
+    registry.get = instrumented_get
+    self.instrumented.append((registry, 'get'))
+
+  def instrument(self, game, engine=None):
+    """ Instrument a game's decisions and deck, its engine when given, and
+    the networks of its resource's registry.
+    """
+    for decision in game.decisions:
+      self.instrument_decision(decision)
+    self.instrument_deck(game.deck)
+    if engine is not None:
+      self.instrument_engine(engine)
+    networks = getattr(game.resource, 'networks', None)
+    if networks is not None and 'get' not in vars(networks):
+      self.instrument_registry(networks)
+
+  def uninstrument(self):
+    # methods were replaced on the instances, removing them uncovers the class methods
+    for (obj, name) in reversed(self.instrumented):
+      if name in vars(obj):
+        delattr(obj, name)
+    self.instrumented = []
+
+  # reports
+  def report(self):
+    with self._lock:
+      labels = { label: histogram.to_dict() for (label, histogram) in self.histograms.items() }
+      for (label, histogram) in self.histograms.items():
+        labels[label]['total'] = histogram.total
+      return {
+        'labels': dict(sorted(labels.items(), key=lambda item: -item[1]['total'])),
+        'stacks': { ';'.join(path): seconds for (path, seconds) in self.stacks.items() },
+      }
+
+  def write_json(self, filename):
+    with open(filename, 'w') as fp:
+      json.dump(self.report(), fp, indent=1)
+
+  def write_collapsed(self, filename):
+    # one line per stack, "frame;frame;frame microseconds", for flamegraph.pl or speedscope
+    with self._lock:
+      lines = [ '{} {}'.format(';'.join(path), int(round(seconds * 1e6)))
+        for (path, seconds) in sorted(self.stacks.items()) ]
+    with open(filename, 'w') as fp:
+      fp.write('\n'.join(lines) + '\n')
+
+  def clear(self):
+    with self._lock:
+      self.histograms = {}
+      self.stacks = {}
@@ -0,0 +1,152 @@
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+from .cards import Library, ImageMode
+from .game import GameResource
+from .network import NetworkRegistry, NETWORK_PATH, PRECISIONS
+from .engine import play_game
+
+# Self-play across processes. The parent loads the library (from its cache,
+# without images) and the networks once, then forks the workers, which
+# share those pages copy-on-write; binary networks are memory-mapped, so
+# their weights stay shared even after a fork. Where fork is not
+# available, each worker loads the library in its initializer instead.
+#
+#   python -m rftg.selfplay --games 1000 --players 2,3,4 --expansions 0,1,2 --output results.jsonl
+
+# resource shared by the games of this process, set by preload() or init_worker()
+_resource = None
+
+
+def preload(path='.', network_path=NETWORK_PATH, networks=(), configurations=(), precision=None):
+  """ Load the library and the networks of each (kind, expansion, players)
+  in networks x configurations, for this process and the workers forked from it.
+  Networks are quantized to precision when given (int8 for bulk runs).
+  """
+  global _resource
+
+  library = Library()
+  library.setup(path, images=ImageMode.NONE)
+  registry = NetworkRegistry(network_path, max_bytes=float('inf'), precision=precision)
+  for kind in networks:
+    for (expansion, players) in configurations:
+      registry.get(kind, expansion, players)
+  _resource = GameResource(library=library, networks=registry)
+  return _resource
+
+
+def init_worker(path, network_path, networks, configurations, precision=None):
+  # forked workers inherit the parent's resource
+  if _resource is None:
+    preload(path, network_path, networks, configurations, precision)
+
+
+def grid(seeds, players=(2,), expansions=(0,)):
+  """ Tasks (seed, players, expansion) for every combination, skipping player
+  counts the expansion has no start worlds for.
+  """
+  return [ (seed, num_players, expansion)
+    for (expansion, num_players, seed) in itertools.product(expansions, players, seeds)
+    if num_players <= 4 + expansion ]
+
+
+def run_game(task, decision_class=None):
+  (seed, num_players, expansion) = task
+  start = time.perf_counter()
+  game = play_game(_resource, num_players, expansion, seed, decision_class)
+  return {
+    'seed': seed,
+    'players': num_players,
+    'expansion': expansion,
+    'rounds': game.round,
+    'scores': [ player.end_vp for player in game.players ],
+    'winners': [ player_index for (player_index, player) in enumerate(game.players) if player.winner ],
+    'seconds': time.perf_counter() - start,
+  }
+
+
+class SelfPlayRunner:
+  """ Play tasks from grid() over a pool of worker processes.
+  run() yields each game's result as soon as it is done, in completion order.
+  """
+
+  def __init__(self, workers=None, path='.', network_path=NETWORK_PATH, networks=(), chunksize=4, precision=None):
+    self.workers = workers or os.cpu_count() or 1
+    self.path = path
+    self.network_path = network_path
+    self.networks = tuple(networks)
+    self.chunksize = chunksize
+    self.precision = precision
+
+  def __repr__(self):
+    return '<SelfPlayRunner {}>'.format(self.workers)
+
+  def run(self, tasks):
+    tasks = list(tasks)
+    configurations = sorted(set((expansion, num_players) for (seed, num_players, expansion) in tasks))
+    initargs = (self.path, self.network_path, self.networks, configurations, self.precision)
+
+    frozen = False
+    if 'fork' in multiprocessing.get_all_start_methods():
+      context = multiprocessing.get_context('fork')
+      preload(*initargs)
+      # keep the preloaded objects out of the collector, so that workers
+      # do not touch (and copy) their pages when collecting
+      gc.freeze()
+      frozen = True
+    else:
+      context = multiprocessing.get_context()
+
+    try:
+      with context.Pool(self.workers, initializer=init_worker, initargs=initargs) as pool:
+        for result in pool.imap_unordered(run_game, tasks, self.chunksize):
+          yield result
+    finally:
+      # the parent's objects are collectable again once the workers are gone
+      if frozen:
+        gc.unfreeze()
+
+
+def main(argv=None):
+  import argparse
+
+  parser = argparse.ArgumentParser(description='Run self-play games over all cores.')
+  parser.add_argument('--games', type=int, default=100, help='games per configuration')
+  parser.add_argument('--seed', type=int, default=0, help='first seed')
+  parser.add_argument('--players', default='2', help='comma separated player counts')
+  parser.add_argument('--expansions', default='0', help='comma separated expansions')
+  parser.add_argument('--workers', type=int, default=None)
+  parser.add_argument('--path', default='.', help='directory of the card library')
+  parser.add_argument('--network-path', default=NETWORK_PATH, help='directory of the networks')
+  parser.add_argument('--networks', default='', help='comma separated network kinds to preload')
+  parser.add_argument('--precision', choices=PRECISIONS, default=None, help='quantize the networks to this precision')
+  parser.add_argument('--output', default=None, help='JSON lines file of game results')
+  args = parser.parse_args(argv)
+
+  players = [ int(value) for value in args.players.split(',') ]
+  expansions = [ int(value) for value in args.expansions.split(',') ]
+  networks = [ kind for kind in args.networks.split(',') if kind ]
+  tasks = grid(range(args.seed, args.seed + args.games), players, expansions)
+  runner = SelfPlayRunner(args.workers, args.path, args.network_path, networks, precision=args.precision)
+
+  output = open(args.output, 'w') if args.output else None
+  start = time.perf_counter()
+  count = 0
+  try:
+    for result in runner.run(tasks):
+      count += 1
+      if output:
+        output.write(json.dumps(result) + '\n')
+  finally:
+    if output:
+      output.close()
+  elapsed = time.perf_counter() - start
+  print('{} games in {:.1f}s, {:.1f} games/s with {} workers'.format(count, elapsed, count / elapsed, runner.workers))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,186 @@
+import functools
+import os
+
+import numpy as np
+
+from .network import Network, sigmoid, softmax, NETWORK_PATH, BINARY_SUFFIX
+
+# TD(lambda) training of eval and role networks with NumPy, after Tesauro
+# and Keldon Jones's engine. A trajectory is the (T, num_input) positions of
+# one game, in order, and the (num_output,) outcome of the game (for the
+# eval network, 1 for the winner). The TD errors of a trajectory are
+#
+#   delta_t = V(s_t+1) - V(s_t),  with V(s_T) the outcome
+#
+# and with weights fixed during a mini-batch, the eligibility traces
+# e_t = lambda e_t-1 + grad V(s_t) accumulate the same update as applying
+# to each position the lambda-discounted sum of the errors that follow it,
+#
+#   E_k = sum over t >= k of lambda^(t-k) delta_t
+#
+# so the traces come down to one product per trajectory with the matrix of
+# the powers of lambda (cached by length), and the whole mini-batch to one
+# backward pass. The errors are applied at the softmax
+# inputs, as the gradient of a cross-entropy loss would be.
+
+TRAJECTORY_DTYPE = np.uint8
+
+
+def new_network(network, expansion, players, input_names, num_hidden=50, num_output=None, advanced=False, seed=0):
+  """ Network with small random weights, to train from scratch. """
+  rng = np.random.default_rng(seed)
+  net = Network(network, expansion, players, advanced)
+  net.num_input = len(input_names)
+  net.num_hidden = num_hidden
+  net.num_output = players if num_output is None else num_output
+  net.input_names = list(input_names)
+  net.hidden = rng.normal(0.0, 0.1, (net.num_input, num_hidden))
+  net.hidden_bias = np.zeros(num_hidden)
+  net.output = rng.normal(0.0, 0.1, (num_hidden, net.num_output))
+  net.output_bias = np.zeros(net.num_output)
+  return net
+
+
+def td_errors(values, outcome):
+  # delta_t of a trajectory whose network outputs are values
+  return np.vstack([ values[1:], outcome ]) - values
+
+
+@functools.lru_cache(maxsize=256)
+def trace_matrix(length, lam):
+  # (T, T) upper triangular L[k, t] = lambda^(t-k), so that E = L @ deltas
+  steps = np.arange(length)[None, :] - np.arange(length)[:, None]
+  matrix = np.where(steps >= 0, lam ** np.maximum(steps, 0), 0.0)
+  matrix.flags.writeable = False
+  return matrix
+
+
+def trace_errors(deltas, lam):
+  """ (T, num_output) eligibility-weighted errors E of a trajectory's TD
+  errors, see the module comment.
+  """
+  return trace_matrix(len(deltas), lam) @ deltas
+
+
+class TDTrainer:
+  """ TD(lambda) on a Network's weights, updated in place. Binary networks
+  are memory-mapped read-only, so the weights are copied to float64 first.
+  """
+
+  def __init__(self, network, alpha=0.05, lam=0.7):
+    self.network = network
+    self.alpha = alpha
+    self.lam = lam
+    network.hidden = np.array(network.hidden, dtype=np.float64)
+    network.hidden_bias = np.array(network.hidden_bias, dtype=np.float64)
+    network.output = np.array(network.output, dtype=np.float64)
+    network.output_bias = np.array(network.output_bias, dtype=np.float64)
+
+  def __repr__(self):
+    return '<TDTrainer {} {}/{}>'.format(self.network.network_name, self.alpha, self.lam)
+
+  def _forward(self, X):
+    network = self.network
+    hidden_result = sigmoid(X @ network.hidden + network.hidden_bias)
+    return (hidden_result, softmax(hidden_result @ network.output + network.output_bias))
+
+  def train_batch(self, trajectories):
+    """ One update from a mini-batch of (positions, outcome) trajectories.
+    Returns the mean squared TD error over the positions.
+    """
+    network = self.network
+    X = np.concatenate([ np.asarray(positions, dtype=np.float64) for (positions, outcome) in trajectories ])
+    (hidden_result, values) = self._forward(X)
+
+    deltas = []
+    start = 0
+    for (positions, outcome) in trajectories:
+      end = start + len(positions)
+      deltas.append(td_errors(values[start:end], np.asarray(outcome, dtype=np.float64)))
+      start = end
+    E = np.concatenate([ trace_errors(delta, self.lam) for delta in deltas ])
+
+    # backward pass of the errors, applied at the softmax inputs
+    hidden_error = (E @ network.output.T) * hidden_result * (1.0 - hidden_result)
+    rate = self.alpha / len(trajectories)
+    network.output += rate * (hidden_result.T @ E)
+    network.output_bias += rate * E.sum(axis=0)
+    network.hidden += rate * (X.T @ hidden_error)
+    network.hidden_bias += rate * hidden_error.sum(axis=0)
+    network.num_training += len(trajectories)
+
+    return float(np.mean(np.concatenate(deltas) ** 2))
+
+  def train(self, trajectories, batch_size=32, epochs=1, seed=0, checkpoint_path=None, checkpoint_every=0):
+    """ Train over the trajectories in shuffled mini-batches, yielding the
+    error of each batch. With checkpoint_path, checkpoints are written every
+    checkpoint_every batches and at the end.
+    """
+    rng = np.random.default_rng(seed)
+    batches = 0
+    for epoch in range(epochs):
+      order = rng.permutation(len(trajectories))
+      for start in range(0, len(order), batch_size):
+        yield self.train_batch([ trajectories[i] for i in order[start:start + batch_size] ])
+        batches += 1
+        if checkpoint_path and checkpoint_every and batches % checkpoint_every == 0:
+          self.checkpoint(checkpoint_path)
+    if checkpoint_path:
+      self.checkpoint(checkpoint_path)
+
+  def checkpoint(self, path):
+    """ Write the network as .net text and its binary form, returning the text filename. """
+    os.makedirs(path, exist_ok=True)
+    filename = os.path.join(path, self.network.network_name)
+    # text first, so the binary is newer and preferred by load_net
+    temp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+    self.network.write_text(temp_filename)
+    os.replace(temp_filename, filename)
+    self.network.write_binary(filename + BINARY_SUFFIX)
+    return filename
+
+
+# trajectories on disk: positions of all games concatenated, as 0/1 bytes
+def save_trajectories(filename, trajectories):
+  positions = np.concatenate([ np.asarray(positions, dtype=TRAJECTORY_DTYPE) for (positions, outcome) in trajectories ])
+  lengths = np.array([ len(positions) for (positions, outcome) in trajectories ], dtype=np.int32)
+  outcomes = np.array([ outcome for (positions, outcome) in trajectories ], dtype=np.float32)
+  np.savez_compressed(filename, positions=positions, lengths=lengths, outcomes=outcomes)
+
+
+def load_trajectories(filename):
+  with np.load(filename) as data:
+    positions = data['positions']
+    lengths = data['lengths']
+    outcomes = data['outcomes']
+  return list(zip(np.split(positions, np.cumsum(lengths)[:-1]), outcomes))
+
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description='Train a network with TD(lambda) on recorded trajectories.')
+  parser.add_argument('trajectories', help='.npz file of save_trajectories()')
+  parser.add_argument('--network', default='eval')
+  parser.add_argument('--expansion', type=int, default=0)
+  parser.add_argument('--players', type=int, default=2)
+  parser.add_argument('--advanced', action='store_true')
+  parser.add_argument('--path', default=NETWORK_PATH, help='directory of the network to start from')
+  parser.add_argument('--output', required=True, help='directory to write the checkpoints to')
+  parser.add_argument('--alpha', type=float, default=0.05)
+  parser.add_argument('--lam', type=float, default=0.7)
+  parser.add_argument('--batch-size', type=int, default=32)
+  parser.add_argument('--epochs', type=int, default=1)
+  parser.add_argument('--checkpoint-every', type=int, default=100, help='batches between checkpoints')
+  args = parser.parse_args()
+  if os.path.abspath(args.output) == os.path.abspath(args.path):
+    parser.error('--output must not be --path, the checkpoints would overwrite the networks they start from')
+
+  network = Network().load_net(args.network, args.expansion, args.players, args.advanced, path=args.path)
+  trainer = TDTrainer(network, args.alpha, args.lam)
+  trajectories = load_trajectories(args.trajectories)
+  for (batch, error) in enumerate(trainer.train(trajectories, args.batch_size, args.epochs,
+      checkpoint_path=args.output, checkpoint_every=args.checkpoint_every)):
+    if batch % 10 == 0:
+      print('batch {}: mean squared TD error {:.5f}'.format(batch, error))
+  print('{} trained to {} iterations'.format(network.network_name, network.num_training))